@@ -0,0 +1,30 @@
+"""Add rolling summary to conversations
+
+Revision ID: 231acdb3092d
+Revises: e2cdc70d71e8
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '231acdb3092d'
+down_revision: Union[str, None] = 'e2cdc70d71e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'summary_message_id')
+    op.drop_column('conversations', 'summary')
@@ -0,0 +1,52 @@
+"""Add per-conversation message sequence and history index
+
+Revision ID: 24227791ebb1
+Revises: 8b9783577c65
+Create Date: 2026-10-18 09:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '24227791ebb1'
+down_revision: Union[str, None] = '8b9783577c65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('seq', sa.Integer(), nullable=True))
+    op.add_column('conversations', sa.Column('last_message_seq', sa.Integer(), server_default='0', nullable=False))
+
+    # Number existing messages in their current (created_at, id) order
+    op.execute("""
+        UPDATE messages SET seq = numbered.rn
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY conversation_id ORDER BY created_at, id) AS rn
+            FROM messages
+        ) AS numbered
+        WHERE messages.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE conversations SET last_message_seq = counts.max_seq
+        FROM (
+            SELECT conversation_id, max(seq) AS max_seq FROM messages GROUP BY conversation_id
+        ) AS counts
+        WHERE conversations.id = counts.conversation_id
+    """)
+
+    op.create_index('ix_messages_conversation_created_id', 'messages', ['conversation_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_messages_conversation_seq', 'messages', ['conversation_id', 'seq'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_conversation_seq', table_name='messages')
+    op.drop_index('ix_messages_conversation_created_id', table_name='messages')
+    op.drop_column('conversations', 'last_message_seq')
+    op.drop_column('messages', 'seq')
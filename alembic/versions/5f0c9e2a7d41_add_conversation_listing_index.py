@@ -0,0 +1,36 @@
+"""Add index for listing a user's conversations by last update
+
+Revision ID: 5f0c9e2a7d41
+Revises: 24227791ebb1
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f0c9e2a7d41'
+down_revision: Union[str, None] = '24227791ebb1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset cursors compare (updated_at, id), so updated_at must never be NULL
+    op.execute("UPDATE conversations SET updated_at = coalesce(created_at, now()) WHERE updated_at IS NULL")
+
+    op.create_index(
+        'ix_conversations_user_updated_id',
+        'conversations',
+        ['user_id', sa.text('updated_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conversations_user_updated_id', table_name='conversations')
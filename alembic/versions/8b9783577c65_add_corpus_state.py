@@ -0,0 +1,34 @@
+"""Add corpus version counter
+
+Revision ID: 8b9783577c65
+Revises: 231acdb3092d
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b9783577c65'
+down_revision: Union[str, None] = '231acdb3092d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    corpus_state = op.create_table('corpus_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(corpus_state, [{'id': 1, 'version': 0}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('corpus_state')
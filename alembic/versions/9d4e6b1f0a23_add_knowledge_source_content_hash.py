@@ -0,0 +1,31 @@
+"""Add content hash to knowledge sources
+
+Revision ID: 9d4e6b1f0a23
+Revises: c3a81f5e92b7
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e6b1f0a23'
+down_revision: Union[str, None] = 'c3a81f5e92b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows keep a NULL hash; NULLs never conflict in a unique index
+    op.add_column('knowledge_sources', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_knowledge_sources_content_hash'), 'knowledge_sources', ['content_hash'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_knowledge_sources_content_hash'), table_name='knowledge_sources')
+    op.drop_column('knowledge_sources', 'content_hash')
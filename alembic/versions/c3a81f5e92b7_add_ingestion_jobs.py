@@ -0,0 +1,58 @@
+"""Add ingestion job queue
+
+Revision ID: c3a81f5e92b7
+Revises: 5f0c9e2a7d41
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a81f5e92b7'
+down_revision: Union[str, None] = '5f0c9e2a7d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ingestion_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source_id', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('lease_owner', sa.String(), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('stage', sa.String(), nullable=True),
+    sa.Column('progress', sa.JSON(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['source_id'], ['knowledge_sources.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ingestion_jobs_id'), 'ingestion_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_ingestion_jobs_source_id'), 'ingestion_jobs', ['source_id'], unique=False)
+    op.create_index('ix_ingestion_jobs_status_run_after', 'ingestion_jobs', ['status', 'run_after'], unique=False)
+
+    # Sources left in 'processing' by a restarted web worker get a job, so the new workers finish them
+    op.execute("""
+        INSERT INTO ingestion_jobs (source_id, kind, status, attempts, max_attempts, run_after, stage, created_at, updated_at)
+        SELECT id, 'ingest', 'queued', 0, 3, now() at time zone 'utc', 'queued', now() at time zone 'utc', now() at time zone 'utc'
+        FROM knowledge_sources WHERE status = 'processing'
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ingestion_jobs_status_run_after', table_name='ingestion_jobs')
+    op.drop_index(op.f('ix_ingestion_jobs_source_id'), table_name='ingestion_jobs')
+    op.drop_index(op.f('ix_ingestion_jobs_id'), table_name='ingestion_jobs')
+    op.drop_table('ingestion_jobs')
@@ -0,0 +1,40 @@
+"""Add knowledge chunk manifest and job payload
+
+Revision ID: e71b3c5d8f10
+Revises: 9d4e6b1f0a23
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71b3c5d8f10'
+down_revision: Union[str, None] = '9d4e6b1f0a23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Sources ingested before this have no manifest; their first re-ingestion
+    # replaces the old positional chunk ids wholesale
+    op.create_table('knowledge_chunks',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('source_id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.ForeignKeyConstraint(['source_id'], ['knowledge_sources.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_knowledge_chunks_source_id'), 'knowledge_chunks', ['source_id'], unique=False)
+    op.add_column('ingestion_jobs', sa.Column('payload', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ingestion_jobs', 'payload')
+    op.drop_index(op.f('ix_knowledge_chunks_source_id'), table_name='knowledge_chunks')
+    op.drop_table('knowledge_chunks')
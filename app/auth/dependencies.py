@@ -1,33 +1,49 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.auth.models import TokenData
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.users.models import User
 from fastapi import Request, HTTPException
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> TokenData:
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username, role=payload.get("role"))
+            raise _credentials_exception()
+        return TokenData(username=username, role=payload.get("role"))
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    token_data = _decode_token(token)
     user = db.query(User).filter(User.username == token_data.username).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Same as get_current_user, but looks the user up without blocking the event loop"""
+    token_data = _decode_token(token)
+    result = await db.execute(select(User).where(User.username == token_data.username))
+    user = result.scalars().first()
+    if user is None:
+        raise _credentials_exception()
     return user
 
 async def get_current_admin(current_user: User = Depends(get_current_user)):
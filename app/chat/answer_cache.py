@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """In-process cache of answers to first-turn questions, looked up by embedding similarity.
+
+    Every entry remembers the corpus version it was generated against; when the
+    version moves on (a knowledge source was added or deleted) all older
+    entries are dropped, so answers never outlive the documents they cite.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = None
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._entries: List[dict] = []
+
+    def _sync_version(self, corpus_version: int):
+        if corpus_version != self._version:
+            if self._entries:
+                logger.info(f"Corpus version changed to {corpus_version}, dropping {len(self._entries)} cached answers")
+            self._version = corpus_version
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._entries = []
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    def lookup(self, embedding: List[float], corpus_version: int) -> Optional[Tuple[str, List[str]]]:
+        """Return (answer, sources) of the most similar cached question above the threshold"""
+        with self._lock:
+            self._sync_version(corpus_version)
+            if self._entries:
+                now = time.monotonic()
+                scores = self._vectors @ self._normalize(embedding)
+                # An expired entry must not shadow a live, slightly less similar one
+                expired = np.fromiter((entry["expires_at"] <= now for entry in self._entries),
+                                      dtype=bool, count=len(self._entries))
+                scores[expired] = -np.inf
+                best = int(np.argmax(scores))
+                entry = self._entries[best]
+                if scores[best] >= self.threshold:
+                    entry["last_used"] = now
+                    metrics.increment("answer_cache.hits")
+                    return entry["answer"], entry["sources"]
+        metrics.increment("answer_cache.misses")
+        return None
+
+    def store(self, embedding: List[float], answer: str, sources: List[str], corpus_version: int):
+        with self._lock:
+            self._sync_version(corpus_version)
+            now = time.monotonic()
+            keep = [i for i, entry in enumerate(self._entries) if entry["expires_at"] > now]
+            if len(keep) >= self.max_entries:
+                keep.sort(key=lambda i: self._entries[i]["last_used"])
+                keep = sorted(keep[len(keep) - self.max_entries + 1:])
+            vector = self._normalize(embedding)[None, :]
+            self._vectors = np.vstack([self._vectors[keep], vector]) if keep else vector
+            self._entries = [self._entries[i] for i in keep] + [{
+                "answer": answer,
+                "sources": list(sources),
+                "expires_at": now + self.ttl,
+                "last_used": now,
+            }]
+            metrics.increment("answer_cache.stores")
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Return the process-wide answer cache, or None when disabled"""
+    global _cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache(
+                    settings.ANSWER_CACHE_THRESHOLD,
+                    settings.ANSWER_CACHE_SIZE,
+                    settings.ANSWER_CACHE_TTL,
+                )
+    return _cache
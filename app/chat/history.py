@@ -0,0 +1,111 @@
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_groq import ChatGroq
+from sqlalchemy import select
+
+from app.chat.models import Conversation, Message
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TEMPLATE = """
+    You maintain a running summary of a conversation between a student and an assistant about skripsi (thesis) guidelines.
+
+    Update the existing summary with the new turns below. Keep facts, decisions and open questions the student still cares about; drop greetings and repetition. Write in the same language as the conversation, in at most {max_words} words.
+
+    Existing summary:
+    {summary}
+
+    New turns:
+    {turns}
+
+    Updated summary:
+    """
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_template(SUMMARY_TEMPLATE)
+
+_summary_chain = None
+_lock = threading.Lock()
+
+
+def select_recent_messages(messages: List[Message], max_turns: Optional[int] = None,
+                           token_budget: Optional[int] = None) -> List[Message]:
+    """Return the newest messages that fit in both the turn limit and the token budget"""
+    max_messages = (max_turns or settings.HISTORY_MAX_TURNS) * 2
+    token_budget = token_budget or settings.HISTORY_TOKEN_BUDGET
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_tokens(message.content or "")
+        if len(kept) >= max_messages or used + tokens > token_budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+def build_history(messages: List[Message]) -> List[Tuple[str, str]]:
+    """Bound the prompt history; the last message is the current question and is always kept"""
+    if not messages:
+        return []
+    recent = select_recent_messages(messages[:-1])
+    return [(msg.role, msg.content) for msg in recent + [messages[-1]]]
+
+
+def get_summary_chain():
+    global _summary_chain
+    if _summary_chain is None:
+        with _lock:
+            if _summary_chain is None:
+                llm = ChatGroq(model=settings.SUMMARY_MODEL, temperature=0)
+                _summary_chain = SUMMARY_PROMPT | llm | StrOutputParser()
+    return _summary_chain
+
+
+async def summarize(summary: Optional[str], messages: List[Message]) -> str:
+    turns = "\n\n".join(
+        f"{'User' if msg.role == 'user' else 'Assistant'}: {msg.content}" for msg in messages)
+    result = await get_summary_chain().ainvoke({
+        "summary": summary or "(none yet)",
+        "turns": turns,
+        "max_words": settings.SUMMARY_MAX_WORDS,
+    })
+    return result.strip()
+
+
+async def fold_history(conversation_id: int):
+    """Fold turns that have fallen out of the prompt window into the conversation summary
+
+    Runs after the response has been sent, so it never adds latency to a chat
+    request. Only messages newer than the last folded one are considered, so
+    the summary is updated incrementally.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            conversation = await db.get(Conversation, conversation_id)
+            if conversation is None:
+                return
+            result = await db.execute(select(Message).where(
+                Message.conversation_id == conversation_id,
+                Message.id > (conversation.summary_message_id or 0)
+            ).order_by(Message.seq.asc()))
+            messages = result.scalars().all()
+
+            recent = select_recent_messages(messages)
+            older = messages[:len(messages) - len(recent)]
+            if not older:
+                return
+
+            conversation.summary = await summarize(conversation.summary, older)
+            conversation.summary_message_id = older[-1].id
+            await db.commit()
+            logger.info(f"Folded {len(older)} messages into the summary of conversation {conversation_id}")
+    except Exception as e:
+        logger.error(f"Failed to update summary for conversation {conversation_id}: {e}")
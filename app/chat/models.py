@@ -1,10 +1,10 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from pydantic import BaseModel, field_validator
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from app.database import Base
+from app.database import Base, UTCDateTime
 
 # SQLAlchemy Models
 class Conversation(Base):
@@ -13,11 +13,21 @@ class Conversation(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     title = Column(String, nullable=True)
-    created_at = Column(DateTime, nullable=True)
-    updated_at = Column(DateTime, nullable=True)
+    created_at = Column(UTCDateTime, nullable=True)
+    updated_at = Column(UTCDateTime, nullable=True)
+    # Rolling summary of the turns that no longer fit in the prompt history
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)  # last message folded into summary
+    last_message_seq = Column(Integer, nullable=False, default=0, server_default="0")
     
     user = relationship("User")
-    messages = relationship("Message", back_populates="conversation")
+    messages = relationship("Message", back_populates="conversation", order_by="Message.id")
+
+# Serves the per-user conversation list newest first, including keyset pages
+Index(
+    "ix_conversations_user_updated_id",
+    Conversation.user_id, Conversation.updated_at.desc(), Conversation.id.desc()
+)
 
 class Message(Base):
     __tablename__ = "messages"
@@ -26,10 +36,16 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
     role = Column(String)  # 'user' or 'assistant'
     content = Column(Text)
-    created_at = Column(DateTime, nullable=True)
+    created_at = Column(UTCDateTime, nullable=True)
+    seq = Column(Integer, nullable=True)  # monotonic position within the conversation
     
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (
+        Index("ix_messages_conversation_created_id", "conversation_id", "created_at", "id"),
+        Index("ix_messages_conversation_seq", "conversation_id", "seq", unique=True),
+    )
+
 # Pydantic Models dengan timezone handling
 class MessageBase(BaseModel):
     role: str
@@ -78,11 +94,20 @@ class ConversationResponse(BaseModel):
         }
 
 class ConversationWithMessages(ConversationResponse):
-    messages: List[MessageResponse]
+    # None when the client asked for the conversation without its messages
+    messages: Optional[List[MessageResponse]] = None
     
     class Config:
         from_attributes = True
 
+class ConversationPage(BaseModel):
+    items: List[ConversationResponse]  # most recently updated first
+    next_cursor: Optional[str] = None  # pass as ?cursor= to load the next page
+
+class MessagePage(BaseModel):
+    items: List[MessageResponse]  # oldest first, ready to render
+    next_cursor: Optional[str] = None  # pass as ?before= to load older messages
+
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[int] = None
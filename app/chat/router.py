@@ -1,37 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
-from typing import List
+import asyncio
+import json
+import logging
+import anyio
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.background import BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select, delete, update, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user_async
 from app.chat.models import (
     Conversation, Message, ConversationCreate, ConversationResponse,
-    ConversationWithMessages, ChatRequest, ChatResponse, MessageResponse
+    ConversationWithMessages, ConversationPage, ChatRequest, ChatResponse, MessageResponse, MessagePage
 )
-from app.chat.service import generate_response
-from app.database import get_db
+from app.chat.history import build_history, fold_history
+from app.chat.service import generate_response, stream_response
+from app.config import settings
+from app.database import get_async_db, AsyncSessionLocal
+from app.knowledge.corpus import get_corpus_version
 from app.users.models import User
+from app.utils.pagination import encode_cursor, decode_cursor
 from app.utils.timezone import get_utc_now  # Import utility function
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-@router.post("/send", response_model=ChatResponse)
-async def send_message(
-    chat_request: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    # Use utility function for consistent UTC time
-    current_utc = get_utc_now()
-    
-    # Check if conversation exists or create a new one
+async def _next_message_seq(db: AsyncSession, conversation_id: int, touched_at=None) -> int:
+    """Reserve the next message sequence number of a conversation
+
+    The row update also serializes concurrent sends to the same conversation
+    until the caller commits. When ``touched_at`` is given the conversation's
+    updated_at is bumped by the same statement.
+    """
+    values = {"last_message_seq": Conversation.last_message_seq + 1}
+    if touched_at is not None:
+        values["updated_at"] = touched_at
+    result = await db.execute(update(Conversation).where(
+        Conversation.id == conversation_id
+    ).values(**values).returning(Conversation.last_message_seq))
+    return result.scalar_one()
+
+async def _start_turn(chat_request: ChatRequest, current_user: User, db: AsyncSession, current_utc):
+    """Find or create the conversation, save the user message and return the prompt history
+
+    Everything is written in a single transaction. Its commit hands the
+    connection back to the pool, so none is held while the LLM generates.
+    """
+    corpus_version = None
     if chat_request.conversation_id:
-        conversation = db.query(Conversation).filter(
+        result = await db.execute(select(Conversation).where(
             Conversation.id == chat_request.conversation_id,
             Conversation.user_id == current_user.id
-        ).first()
+        ))
+        conversation = result.scalars().first()
         
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
+        
+        user_message = Message(
+            conversation_id=conversation.id,
+            role="user",
+            content=chat_request.message,
+            created_at=current_utc,
+            seq=await _next_message_seq(db, conversation.id)
+        )
+        db.add(user_message)
+        
+        # Fetch only the newest rows the prompt can use (via the (conversation_id, seq) index);
+        # autoflush is off, so the new message is appended rather than read back
+        result = await db.execute(select(Message).where(
+            Message.conversation_id == conversation.id
+        ).order_by(Message.seq.desc()).limit(settings.HISTORY_MAX_TURNS * 2))
+        conversation_messages = list(reversed(result.scalars().all())) + [user_message]
     else:
         # Create new conversation with default title (first message content)
         title_preview = chat_request.message[:30] + "..." if len(chat_request.message) > 30 else chat_request.message
@@ -39,98 +84,251 @@ async def send_message(
             user_id=current_user.id, 
             title=title_preview,
             created_at=current_utc,
-            updated_at=current_utc
+            updated_at=current_utc,
+            last_message_seq=1
         )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-    
-    # Save user message
-    user_message = Message(
-        conversation_id=conversation.id,
-        role="user",
-        content=chat_request.message,
-        created_at=current_utc
-    )
-    db.add(user_message)
-    db.commit()
-    
-    # Get conversation history for context
-    conversation_messages = db.query(Message).filter(
-        Message.conversation_id == conversation.id
-    ).order_by(Message.created_at.asc()).all()
+        user_message = Message(
+            conversation=conversation,
+            role="user",
+            content=chat_request.message,
+            created_at=current_utc,
+            seq=1
+        )
+        db.add_all([conversation, user_message])
+        conversation_messages = [user_message]
+        # The answer cache only serves first-turn questions, so only they need the corpus version
+        corpus_version = await get_corpus_version(db)
     
-    # Generate response using RAG
-    history = [(msg.role, msg.content) for msg in conversation_messages]
-    response_text = generate_response(chat_request.message, history)
+    await db.commit()
     
-    # Save assistant message with same timestamp
+    # Keep only the recent turns that fit the token budget; older ones live in conversation.summary
+    history = build_history(conversation_messages)
+    return conversation, history, corpus_version
+
+async def _finish_turn(db: AsyncSession, conversation_id: int, content: str, current_utc) -> Message:
+    """Save the assistant message and bump updated_at in one short transaction"""
     assistant_message = Message(
-        conversation_id=conversation.id,
+        conversation_id=conversation_id,
         role="assistant",
-        content=response_text,
-        created_at=current_utc  # Use same timestamp
+        content=content,
+        created_at=current_utc,
+        seq=await _next_message_seq(db, conversation_id, touched_at=current_utc)
     )
     db.add(assistant_message)
+    await db.commit()
+    return assistant_message
+
+@router.post("/send", response_model=ChatResponse)
+async def send_message(
+    chat_request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Use utility function for consistent UTC time
+    current_utc = get_utc_now()
+    
+    conversation, history, corpus_version = await _start_turn(chat_request, current_user, db, current_utc)
+    
+    # Generate response using RAG (near-duplicate first questions are served from the answer cache)
+    response_text = await generate_response(chat_request.message, history, conversation.summary, corpus_version)
+    
+    # Save assistant message with same timestamp
+    assistant_message = await _finish_turn(db, conversation.id, response_text, current_utc)
     
-    # Update conversation's updated_at timestamp
-    conversation.updated_at = current_utc
-    db.commit()
-    db.refresh(assistant_message)
+    # Fold turns that fell out of the history window into the summary after responding
+    background_tasks.add_task(fold_history, conversation.id)
     
     return {
         "message": assistant_message,
         "conversation_id": conversation.id
     }
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/stream")
+async def stream_message(
+    chat_request: ChatRequest,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Answer like /send, but stream the tokens as server-sent events
+
+    Events: 'meta' (conversation id and sources), 'token' for each piece of
+    the answer, then 'done' with the saved assistant message, or 'error'.
+    """
+    current_utc = get_utc_now()
+    
+    conversation, history, corpus_version = await _start_turn(chat_request, current_user, db, current_utc)
+    conversation_id = conversation.id
+    
+    sources, tokens = await stream_response(chat_request.message, history, conversation.summary, corpus_version)
+    
+    async def event_stream():
+        yield _sse("meta", {"conversation_id": conversation_id, "sources": sources})
+        
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield _sse("token", {"content": token})
+        except (asyncio.CancelledError, GeneratorExit):
+            # Starlette cancels or closes the generator when the client
+            # disconnects; don't save a half-finished answer
+            logger.info(f"Client disconnected from conversation {conversation_id} stream")
+            raise
+        except Exception as e:
+            logger.error(f"Error while streaming response for conversation {conversation_id}: {e}")
+            yield _sse("error", {"detail": "Failed to generate a response"})
+            return
+        finally:
+            # Stop the LLM stream even when the surrounding scope is already cancelled
+            with anyio.CancelScope(shield=True):
+                await tokens.aclose()
+        
+        # The request's session is already closed once streaming starts, so use a new one
+        async with AsyncSessionLocal() as session:
+            assistant_message = await _finish_turn(session, conversation_id, "".join(parts), current_utc)
+        
+        message = MessageResponse.model_validate(assistant_message)
+        yield _sse("done", {"message": message.model_dump(mode="json"), "conversation_id": conversation_id})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(fold_history, conversation_id)
+    )
+
 @router.get("/conversations", response_model=List[ConversationResponse])
 async def list_conversations(
     skip: int = 0,
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    conversations = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.user_id == current_user.id
-    ).order_by(Conversation.updated_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Conversation.updated_at.desc()).offset(skip).limit(limit))
     
-    return conversations
+    return result.scalars().all()
+
+def conversation_page_query(user_id: int, cursor: Optional[str], limit: int):
+    """Select one keyset page of a user's conversations plus one row to detect more
+
+    Ordered by (updated_at, id) descending so the (user_id, updated_at, id)
+    index serves both the filter and the sort at any depth.
+    """
+    query = select(Conversation).where(Conversation.user_id == user_id)
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            after = (datetime.fromisoformat(values["updated_at"]), int(values["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < after)
+    return query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+
+@router.get("/conversations/page", response_model=ConversationPage)
+async def list_conversations_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    result = await db.execute(conversation_page_query(current_user.id, cursor, limit))
+    conversations = result.scalars().all()
+    
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        last = conversations[-1]
+        next_cursor = encode_cursor({"updated_at": last.updated_at.isoformat(), "id": last.id})
+    
+    return {"items": conversations, "next_cursor": next_cursor}
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationWithMessages)
 async def get_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    include_messages: bool = True,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    conversation = db.query(Conversation).filter(
+    query = select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    )
+    if include_messages:
+        # Messages are loaded eagerly since lazy loading isn't available on an async session
+        query = query.options(selectinload(Conversation.messages))
+    result = await db.execute(query)
+    conversation = result.scalars().first()
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
+    if not include_messages:
+        return ConversationResponse.model_validate(conversation)
     return conversation
 
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def list_messages(
+    conversation_id: int,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Page through a conversation from the newest message backwards
+
+    Keyset pagination on the message sequence, so every page costs the same
+    regardless of how long the conversation is.
+    """
+    result = await db.execute(select(Conversation.id).where(
+        Conversation.id == conversation_id,
+        Conversation.user_id == current_user.id
+    ))
+    if result.scalar() is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    query = select(Message).where(Message.conversation_id == conversation_id)
+    if before:
+        try:
+            before_seq = int(decode_cursor(before)["seq"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(Message.seq < before_seq)
+    result = await db.execute(query.order_by(Message.seq.desc()).limit(limit + 1))
+    messages = result.scalars().all()
+    
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor({"seq": messages[-1].seq})
+    
+    return {"items": list(reversed(messages)), "next_cursor": next_cursor}
+
 @router.delete("/conversations/{conversation_id}", status_code=200)
 async def delete_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    conversation = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
+    conversation = result.scalars().first()
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     # Delete all messages in the conversation
-    db.query(Message).filter(Message.conversation_id == conversation_id).delete()
+    await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
     
     # Delete the conversation
-    db.delete(conversation)
-    db.commit()
+    await db.delete(conversation)
+    await db.commit()
     
-    return {"detail": "Conversation deleted successfully"}
\ No newline at end of file
+    return {"detail": "Conversation deleted successfully"}
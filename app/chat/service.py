@@ -1,28 +1,13 @@
-from typing import List, Tuple
+import threading
+from typing import AsyncIterator, List, Optional, Tuple
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_groq import ChatGroq
-from app.vector_store.pinecone_client import retrieve_relevant_chunks, format_context_with_sources
+from app.chat.answer_cache import get_answer_cache
+from app.config import settings
+from app.vector_store.pinecone_client import embed_query, retrieve_relevant_chunks, format_context_with_sources
 
-def generate_response(query: str, history: List[Tuple[str, str]] = None) -> str:
-    """Generate a response using RAG with conversation history and show sources"""
-    
-    llm = ChatGroq(model="llama-3.3-70b-versatile")
-    
-    context_chunks = retrieve_relevant_chunks(query)
-    context, sources = format_context_with_sources(context_chunks)
-    
-    chat_history = ""
-    if history:
-        for i, (role, content) in enumerate(history):
-            # Skip the most recent user message as it's already in the query
-            if i == len(history) - 1 and role == "user":
-                continue
-            prefix = "User: " if role == "user" else "Assistant: "
-            chat_history += f"{prefix}{content}\n\n"
-
-    template = """
+RAG_TEMPLATE = """
     You are a helpful assistant specializing in providing information about skripsi (thesis) guidelines and processes.
     
     Your task is to answer the user's question based on the provided context. If the answer is not in the context or you're unsure, say that you don't know rather than making up information.
@@ -46,20 +31,118 @@ def generate_response(query: str, history: List[Tuple[str, str]] = None) -> str:
     Sources used: {sources}
     """
 
-    prompt = ChatPromptTemplate.from_template(template)
-
-    rag_chain = (
-        {
-            "context": lambda x: context,
-            "question": lambda x: x,
-            "chat_history": lambda _: chat_history,
-            "sources": lambda _: ", ".join(sources)
-        }
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    
-    response = rag_chain.invoke(query)
+# Parsed once at import; the chain below is built once per process and
+# receives the per-request values as its input dict
+RAG_PROMPT = ChatPromptTemplate.from_template(RAG_TEMPLATE)
+
+_llm = None
+_rag_chain = None
+_lock = threading.Lock()
+
+def get_llm() -> ChatGroq:
+    """Return the shared chat model client"""
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                _llm = ChatGroq(model=settings.CHAT_MODEL)
+    return _llm
+
+def get_rag_chain():
+    """Return the shared prompt | llm | parser chain"""
+    global _rag_chain
+    if _rag_chain is None:
+        llm = get_llm()
+        with _lock:
+            if _rag_chain is None:
+                _rag_chain = RAG_PROMPT | llm | StrOutputParser()
+    return _rag_chain
+
+def format_chat_history(history: List[Tuple[str, str]] = None, summary: Optional[str] = None) -> str:
+    chat_history = ""
+    if summary:
+        chat_history += f"Summary of the earlier conversation: {summary}\n\n"
+    if history:
+        for i, (role, content) in enumerate(history):
+            # Skip the most recent user message as it's already in the query
+            if i == len(history) - 1 and role == "user":
+                continue
+            prefix = "User: " if role == "user" else "Assistant: "
+            chat_history += f"{prefix}{content}\n\n"
+    return chat_history
+
+async def _build_chain_inputs(query: str, history: List[Tuple[str, str]] = None,
+                              summary: Optional[str] = None) -> Tuple[dict, set]:
+    """Retrieve context for the query and build the input dict for the RAG chain"""
+    context_chunks = await retrieve_relevant_chunks(query)
+    context, sources = format_context_with_sources(context_chunks)
+    inputs = {
+        "context": context,
+        "question": query,
+        "chat_history": format_chat_history(history, summary),
+        "sources": ", ".join(sources)
+    }
+    return inputs, sources
+
+def _is_first_turn(history: List[Tuple[str, str]] = None) -> bool:
+    return not history or len(history) == 1
+
+async def _cached_answer(query: str, history, corpus_version: Optional[int]):
+    """Look up a stored answer for a near-duplicate first-turn question
+
+    Returns the cache, the query embedding and the hit (or None), so that a
+    miss can be stored once the answer has been generated.
+    """
+    cache = get_answer_cache()
+    if cache is None or corpus_version is None or not _is_first_turn(history):
+        return None, None, None
+    embedding = await embed_query(query)
+    return cache, embedding, cache.lookup(embedding, corpus_version)
+
+async def generate_response(query: str, history: List[Tuple[str, str]] = None,
+                            summary: Optional[str] = None, corpus_version: Optional[int] = None) -> str:
+    """Generate a response using RAG with conversation history and show sources
+
+    When ``corpus_version`` is given, first-turn questions go through the
+    semantic answer cache.
+    """
+    cache, embedding, hit = await _cached_answer(query, history, corpus_version)
+    if hit is not None:
+        return hit[0]
+
+    inputs, sources = await _build_chain_inputs(query, history, summary)
+    response = await get_rag_chain().ainvoke(inputs)
     
-    return response
\ No newline at end of file
+    if cache is not None:
+        cache.store(embedding, response, sorted(sources), corpus_version)
+    return response
+
+async def stream_response(query: str, history: List[Tuple[str, str]] = None,
+                          summary: Optional[str] = None,
+                          corpus_version: Optional[int] = None) -> Tuple[List[str], AsyncIterator[str]]:
+    """Like generate_response, but return the sources and an iterator over the answer tokens"""
+    cache, embedding, hit = await _cached_answer(query, history, corpus_version)
+    if hit is not None:
+        answer, sources = hit
+
+        async def replay():
+            yield answer
+        return sources, replay()
+
+    inputs, sources = await _build_chain_inputs(query, history, summary)
+    sources = sorted(sources)
+    tokens = get_rag_chain().astream(inputs)
+    if cache is None:
+        return sources, tokens
+
+    async def stream_and_store():
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield token
+        finally:
+            await tokens.aclose()
+        # Only complete answers are cached; an interrupted stream never gets here
+        cache.store(embedding, "".join(parts), sources, corpus_version)
+    return sources, stream_and_store()
@@ -17,16 +17,108 @@ class Settings(BaseSettings):
     
     # Groq settings
     GROQ_API_KEY: str = os.getenv("GROQ_API_KEY")
+    TRANSCRIPTION_MODEL: str = os.getenv("TRANSCRIPTION_MODEL", "whisper-large-v3-turbo")
+    TRANSCRIPTION_SEGMENT_SECONDS: int = int(os.getenv("TRANSCRIPTION_SEGMENT_SECONDS", "600"))
+    TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS: int = int(os.getenv("TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS", "15"))
+    TRANSCRIPTION_MAX_CONCURRENCY: int = int(os.getenv("TRANSCRIPTION_MAX_CONCURRENCY", "2"))
+    CHAT_MODEL: str = os.getenv("CHAT_MODEL", "llama-3.3-70b-versatile")
+    SUMMARY_MODEL: str = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+
+    # Conversation history sent with each prompt
+    HISTORY_MAX_TURNS: int = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+    SUMMARY_MAX_WORDS: int = int(os.getenv("SUMMARY_MAX_WORDS", "200"))
+
+    # Semantic cache of answers to first-turn questions
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+    ANSWER_CACHE_TTL: int = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
     
     # Mistral settings
     MISTRAL_API_KEY: str = os.getenv("MISTRAL_API_KEY")
+    OCR_MODEL: str = os.getenv("OCR_MODEL", "mistral-ocr-latest")
+    OCR_PAGES_PER_REQUEST: int = int(os.getenv("OCR_PAGES_PER_REQUEST", "16"))
+    OCR_MAX_CONCURRENCY: int = int(os.getenv("OCR_MAX_CONCURRENCY", "4"))
+    OCR_TEXT_ONLY: bool = os.getenv("OCR_TEXT_ONLY", "false").lower() == "true"  # drop image position references
+    LOCAL_EXTRACTION_ENABLED: bool = os.getenv("LOCAL_EXTRACTION_ENABLED", "true").lower() == "true"
+    LOCAL_PDF_MIN_CHARS_PER_PAGE: int = int(os.getenv("LOCAL_PDF_MIN_CHARS_PER_PAGE", "50"))
+    LOCAL_PDF_MIN_READABLE_RATIO: float = float(os.getenv("LOCAL_PDF_MIN_READABLE_RATIO", "0.8"))
     
     # Pinecone settings
     PINECONE_API_KEY: str = os.getenv("PINECONE_API_KEY")
     PINECONE_INDEX_NAME: str = os.getenv("PINECONE_INDEX_NAME", "ragv2")
+    PINECONE_POOL_THREADS: int = int(os.getenv("PINECONE_POOL_THREADS", "4"))
+    PINECONE_CONNECTION_POOL_MAXSIZE: int = int(os.getenv("PINECONE_CONNECTION_POOL_MAXSIZE", "10"))
+    # Pinecone rejects upsert requests over 2 MB; batches are split below this many bytes of JSON
+    PINECONE_UPSERT_MAX_BYTES: int = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", str(1536 * 1024)))
+
+    # Vector store backend: 'pinecone' or 'local'
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+    LOCAL_INDEX_DIR: str = os.getenv("LOCAL_INDEX_DIR", "vector_index")
+    LOCAL_INDEX_SEARCH: str = os.getenv("LOCAL_INDEX_SEARCH", "flat")  # 'flat' or 'ivf'
+    LOCAL_INDEX_IVF_NLIST: int = int(os.getenv("LOCAL_INDEX_IVF_NLIST", "64"))
+    LOCAL_INDEX_IVF_NPROBE: int = int(os.getenv("LOCAL_INDEX_IVF_NPROBE", "8"))
+
+    # Retrieval: 'dense' (vector only) or 'hybrid' (vector + BM25 with rank fusion)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "dense")
+    RETRIEVAL_K: int = int(os.getenv("RETRIEVAL_K", "5"))
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    LEXICAL_INDEX_PATH: str = os.getenv("LEXICAL_INDEX_PATH", "vector_index/bm25.json")
+
+    # Embeddings
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+
+    # Ingestion writer
+    CHUNK_TOKENS: int = int(os.getenv("CHUNK_TOKENS", "400"))  # chunk size in embedding-model tokens
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))  # only within a long section
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+    INGEST_MAX_CONCURRENCY: int = int(os.getenv("INGEST_MAX_CONCURRENCY", "4"))
+    INGEST_MAX_RETRIES: int = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+    INGEST_RETRY_BACKOFF: float = float(os.getenv("INGEST_RETRY_BACKOFF", "1.0"))
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "4"))  # batches buffered between pipeline stages
+
+    # Ingestion job queue and worker processes (python -m app.knowledge.worker)
+    INGEST_WORKER_CONCURRENCY: int = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2"))
+    INGEST_WORKER_POLL_INTERVAL: float = float(os.getenv("INGEST_WORKER_POLL_INTERVAL", "2.0"))
+    INGEST_JOB_LEASE_SECONDS: int = int(os.getenv("INGEST_JOB_LEASE_SECONDS", "300"))
+    INGEST_JOB_MAX_ATTEMPTS: int = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+    INGEST_JOB_RETRY_BACKOFF: float = float(os.getenv("INGEST_JOB_RETRY_BACKOFF", "30"))
+
+    # Concurrent calls per external provider, per worker process
+    MISTRAL_MAX_CONCURRENCY: int = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "4"))
+    GROQ_MAX_CONCURRENCY: int = int(os.getenv("GROQ_MAX_CONCURRENCY", "2"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+
+    # Persistent cache of OCR and transcription output keyed by file sha256, extractor and model
+    EXTRACTION_CACHE_ENABLED: bool = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+    EXTRACTION_CACHE_PATH: str = os.getenv("EXTRACTION_CACHE_PATH", "cache/extractions.sqlite3")
+    EXTRACTION_CACHE_MAX_MB: int = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+
+    # Persistent chunk embedding cache keyed by sha256 of the chunk text
+    CHUNK_EMBEDDING_CACHE_ENABLED: bool = os.getenv("CHUNK_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    CHUNK_EMBEDDING_CACHE_PATH: str = os.getenv("CHUNK_EMBEDDING_CACHE_PATH", "cache/chunk_embeddings.sqlite3")
+    CHUNK_EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+    # Query embedding cache: 'memory', 'redis' or 'none'
+    QUERY_EMBEDDING_CACHE_BACKEND: str = os.getenv("QUERY_EMBEDDING_CACHE_BACKEND", "memory")
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    QUERY_EMBEDDING_CACHE_TTL: int = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Shared HTTP connection pool for API clients
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "60"))
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
     
     # File storage
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    UPLOAD_MAX_SIZE_MB: int = int(os.getenv("UPLOAD_MAX_SIZE_MB", "30"))
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    UPLOAD_PART_SIZE: int = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))  # multipart part size, min 5 MB
 
     # Add these to your Settings class
     DO_SPACE_REGION: str = os.getenv("DO_SPACE_REGION")
@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine
+from datetime import timezone
+from sqlalchemy import create_engine, DateTime
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -9,12 +12,45 @@ SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def get_async_database_url(url: str) -> str:
+    """Translate the sync database URL into its async driver equivalent"""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            url = "postgresql+asyncpg://" + url[len(prefix):]
+            break
+    # asyncpg calls libpq's sslmode parameter 'ssl'
+    return url.replace("sslmode=", "ssl=")
+
+async_engine = create_async_engine(get_async_database_url(SQLALCHEMY_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+class UTCDateTime(TypeDecorator):
+    """DateTime column that stores timezone-aware values as naive UTC
+
+    asyncpg refuses aware datetimes for 'timestamp without time zone'
+    columns, which psycopg2 silently accepted.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async DB session for handlers on the event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
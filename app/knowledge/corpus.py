@@ -0,0 +1,19 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.knowledge.models import CorpusState
+from app.utils.timezone import get_utc_now
+
+def bump_corpus_version(db: Session):
+    """Mark the searchable corpus as changed; the caller commits"""
+    result = db.execute(update(CorpusState).where(CorpusState.id == 1).values(
+        version=CorpusState.version + 1,
+        updated_at=get_utc_now()
+    ))
+    if result.rowcount == 0:
+        db.add(CorpusState(id=1, version=1, updated_at=get_utc_now()))
+
+async def get_corpus_version(db: AsyncSession) -> int:
+    result = await db.execute(select(CorpusState.version).where(CorpusState.id == 1))
+    return result.scalar() or 0
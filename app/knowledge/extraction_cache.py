@@ -0,0 +1,201 @@
+import codecs
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Callable, Iterable, Iterator, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def file_content_hash(file_path: str) -> str:
+    """sha256 hex digest of a file, read in 1 MB blocks"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class ExtractionCache:
+    """Persistent cache from (file sha256, extractor, model) to extracted text.
+
+    OCR and transcription are the slowest and most expensive ingestion
+    stages, so a retried job or a re-chunking run reuses their output. Backed
+    by SQLite in WAL mode so all worker processes on a host share it; texts
+    are stored zlib-compressed and the least recently used entries are
+    evicted once the total exceeds ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " content_hash TEXT NOT NULL,"
+            " extractor TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " text BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (content_hash, extractor, model))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_extractions_last_used ON extractions (last_used)")
+        self._conn.commit()
+
+    def get_compressed(self, content_hash: str, extractor: str, model: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM extractions WHERE content_hash = ? AND extractor = ? AND model = ?",
+                (content_hash, extractor, model),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE extractions SET last_used = ? WHERE content_hash = ? AND extractor = ? AND model = ?",
+                    (time.time(), content_hash, extractor, model),
+                )
+                self._conn.commit()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def get(self, content_hash: str, extractor: str, model: str) -> Optional[str]:
+        blob = self.get_compressed(content_hash, extractor, model)
+        return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+    def put_compressed(self, content_hash: str, extractor: str, model: str, blob: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (content_hash, extractor, model, text, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, extractor, model, blob, len(blob), time.time()),
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+            if total > self.max_bytes:
+                # Evict oldest first until the cache is back under 90% of its cap
+                excess = total - int(self.max_bytes * 0.9)
+                evicted = 0
+                for rowid, size in self._conn.execute(
+                        "SELECT rowid, size FROM extractions ORDER BY last_used ASC").fetchall():
+                    if excess <= 0:
+                        break
+                    self._conn.execute("DELETE FROM extractions WHERE rowid = ?", (rowid,))
+                    excess -= size
+                    evicted += 1
+                self.evictions += evicted
+            self._conn.commit()
+
+    def put(self, content_hash: str, extractor: str, model: str, text: str):
+        self.put_compressed(content_hash, extractor, model, zlib.compress(text.encode("utf-8"), 6))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Return the process-wide extraction cache, or None when disabled"""
+    global _cache
+    if not settings.EXTRACTION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExtractionCache(
+                    settings.EXTRACTION_CACHE_PATH,
+                    settings.EXTRACTION_CACHE_MAX_MB * 1024 * 1024,
+                )
+    return _cache
+
+
+def _decompressed_blocks(blob: bytes, block_size: int = 1024 * 1024) -> Iterator[str]:
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while blob:
+        data = decompressor.decompress(blob, block_size)
+        blob = decompressor.unconsumed_tail
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(decompressor.flush(), final=True)
+    if text:
+        yield text
+
+
+def stream_with_cache(file_path: str, extractor: str, model: str,
+                      iterate: Callable[[], Iterable[str]]) -> Iterator[str]:
+    """Yield the cached text for this file, extractor and model in blocks, or
+    stream ``iterate()`` through while compressing it into the cache
+
+    If the consumer stops early (say the upsert stage failed) the rest is
+    still extracted into the cache when the generator is closed, so a retry
+    doesn't pay for OCR again. Nothing is stored if extraction fails.
+    """
+    cache = get_extraction_cache()
+    if cache is None:
+        yield from iterate()
+        return
+    content_hash = file_content_hash(file_path)
+    blob = cache.get_compressed(content_hash, extractor, model)
+    if blob is not None:
+        logger.info(f"Using cached {extractor} ({model}) output for {file_path}")
+        yield from _decompressed_blocks(blob)
+        return
+    compressor = zlib.compressobj(6)
+    parts = []
+    extracted = False
+    pieces = iter(iterate())
+    try:
+        for piece in pieces:
+            parts.append(compressor.compress(piece.encode("utf-8")))
+            extracted = extracted or bool(piece)
+            yield piece
+    except GeneratorExit:
+        try:
+            for piece in pieces:
+                parts.append(compressor.compress(piece.encode("utf-8")))
+                extracted = extracted or bool(piece)
+        except Exception as e:
+            logger.warning(f"Could not finish {extractor} of {file_path} for the cache: {e}")
+            return
+        logger.info(f"Finished {extractor} of {file_path} for the cache after its consumer stopped")
+    if extracted:
+        parts.append(compressor.flush())
+        cache.put_compressed(content_hash, extractor, model, b"".join(parts))
+
+
+def extract_with_cache(file_path: str, extractor: str, model: str, extract: Callable[[], str]) -> str:
+    """Return the cached text for this file, extractor and model, or run ``extract`` and store it"""
+    return "".join(stream_with_cache(file_path, extractor, model, lambda: [extract()]))
@@ -0,0 +1,166 @@
+import logging
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.knowledge.models import IngestionJob, KnowledgeSource
+from app.storage.uploads import delete_stored_file
+from app.utils.timezone import get_utc_now
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    source_id: int
+    kind: str
+    attempts: int
+    max_attempts: int
+    payload: Optional[Dict[str, Any]] = None
+
+
+def enqueue_job(db: Session, source_id: int, kind: str = "ingest",
+                payload: Optional[Dict[str, Any]] = None) -> IngestionJob:
+    """Queue ingestion work for a knowledge source; the caller commits"""
+    now = get_utc_now()
+    job = IngestionJob(
+        source_id=source_id,
+        kind=kind,
+        payload=payload,
+        status="queued",
+        attempts=0,
+        max_attempts=settings.INGEST_JOB_MAX_ATTEMPTS,
+        run_after=now,
+        stage="queued",
+        progress={},
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(job)
+    return job
+
+
+def discard_replacement_file(job_id: int, kind: str, payload: Optional[Dict[str, Any]]):
+    """Delete the uploaded replacement file of a re-ingestion that will never be swapped in"""
+    if kind != "reingest" or not payload:
+        return
+    try:
+        delete_stored_file(payload["file_path"])
+    except Exception as e:
+        logger.error(f"Failed to delete replacement file of job {job_id}: {e}")
+
+
+def claim_job(worker_id: str) -> Optional[ClaimedJob]:
+    """Lease the next runnable job to ``worker_id``
+
+    Runnable means queued and due, or running under a lease that expired
+    because its worker died. SKIP LOCKED lets many workers poll the table
+    without blocking on, or double-claiming, the same row.
+    """
+    now = get_utc_now()
+    with SessionLocal() as db:
+        while True:
+            job = db.execute(
+                select(IngestionJob).where(or_(
+                    and_(IngestionJob.status == "queued", IngestionJob.run_after <= now),
+                    and_(IngestionJob.status == "running", IngestionJob.lease_expires_at < now),
+                )).order_by(IngestionJob.run_after, IngestionJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).scalars().first()
+            if job is None:
+                return None
+
+            if job.status == "running":
+                logger.warning(f"Job {job.id} lease held by {job.lease_owner} expired")
+                if job.attempts >= job.max_attempts:
+                    # The worker died on the last attempt; don't run it again
+                    job.status = "failed"
+                    job.last_error = job.last_error or "Worker lease expired"
+                    job.lease_owner = None
+                    job.lease_expires_at = None
+                    job.updated_at = now
+                    if job.kind == "ingest":
+                        db.execute(update(KnowledgeSource).where(
+                            KnowledgeSource.id == job.source_id).values(status="failed"))
+                    db.commit()
+                    discard_replacement_file(job.id, job.kind, job.payload)
+                    continue
+
+            job.status = "running"
+            job.attempts += 1
+            job.lease_owner = worker_id
+            job.lease_expires_at = now + timedelta(seconds=settings.INGEST_JOB_LEASE_SECONDS)
+            job.updated_at = now
+            db.commit()
+            return ClaimedJob(job.id, job.source_id, job.kind, job.attempts, job.max_attempts, job.payload)
+
+
+def _update_owned(job_id: int, worker_id: str, **values) -> bool:
+    """Update a job only while ``worker_id`` still holds its lease"""
+    with SessionLocal() as db:
+        result = db.execute(update(IngestionJob).where(
+            IngestionJob.id == job_id,
+            IngestionJob.lease_owner == worker_id,
+            IngestionJob.status == "running",
+        ).values(updated_at=get_utc_now(), **values))
+        db.commit()
+        return result.rowcount == 1
+
+
+def extend_lease(job_id: int, worker_id: str) -> bool:
+    return _update_owned(
+        job_id, worker_id,
+        lease_expires_at=get_utc_now() + timedelta(seconds=settings.INGEST_JOB_LEASE_SECONDS))
+
+
+def report_progress(job_id: int, worker_id: str, stage: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+    """Record the stage a job has reached; also renews the lease"""
+    logger.info(f"Job {job_id} stage {stage}: {progress or {}}")
+    return _update_owned(
+        job_id, worker_id,
+        stage=stage,
+        progress=progress or {},
+        lease_expires_at=get_utc_now() + timedelta(seconds=settings.INGEST_JOB_LEASE_SECONDS))
+
+
+def complete_job(job_id: int, worker_id: str) -> bool:
+    return _update_owned(
+        job_id, worker_id, status="succeeded", stage="done", last_error=None,
+        lease_owner=None, lease_expires_at=None)
+
+
+def fail_job(job: ClaimedJob, worker_id: str, error: str) -> bool:
+    """Requeue the job with exponential backoff, or give up after max_attempts"""
+    if job.attempts < job.max_attempts:
+        delay = settings.INGEST_JOB_RETRY_BACKOFF * (2 ** (job.attempts - 1)) * (1 + random.random() / 2)
+        logger.warning(
+            f"Job {job.id} failed (attempt {job.attempts}/{job.max_attempts}): {error}; "
+            f"retrying in {delay:.0f}s")
+        return _update_owned(
+            job.id, worker_id, status="queued", last_error=error,
+            run_after=get_utc_now() + timedelta(seconds=delay),
+            lease_owner=None, lease_expires_at=None)
+
+    logger.error(f"Job {job.id} failed permanently after {job.attempts} attempts: {error}")
+    with SessionLocal() as db:
+        result = db.execute(update(IngestionJob).where(
+            IngestionJob.id == job.id,
+            IngestionJob.lease_owner == worker_id,
+        ).values(status="failed", last_error=error, lease_owner=None, lease_expires_at=None,
+                 updated_at=get_utc_now()))
+        # A failed re-ingestion leaves the previous version in place and searchable
+        if result.rowcount == 1 and job.kind == "ingest":
+            db.execute(update(KnowledgeSource).where(
+                KnowledgeSource.id == job.source_id).values(status="failed"))
+        db.commit()
+    if result.rowcount == 1:
+        discard_replacement_file(job.id, job.kind, job.payload)
+    return result.rowcount == 1
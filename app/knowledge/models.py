@@ -1,10 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from pydantic import BaseModel, field_validator
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime, timezone
 import os
-from app.database import Base
+from app.database import Base, UTCDateTime
 
 # SQLAlchemy Models
 
@@ -19,9 +19,55 @@ class KnowledgeSource(Base):
     status = Column(String, default="processing")  # 'processing', 'completed', 'failed'
     uploaded_by = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, nullable=True)
+    content_hash = Column(String(64), nullable=True, unique=True, index=True)  # sha256 of the uploaded file
 
     user = relationship("User")
 
+
+class KnowledgeChunk(Base):
+    """Manifest of the chunk ids currently stored in the vector index for a source"""
+    __tablename__ = "knowledge_chunks"
+
+    id = Column(String, primary_key=True)  # vector id: source_<source_id>_<content hash prefix>
+    source_id = Column(Integer, ForeignKey("knowledge_sources.id"), nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False)
+
+
+class CorpusState(Base):
+    """Single-row counter bumped whenever the searchable corpus changes"""
+    __tablename__ = "corpus_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+
+class IngestionJob(Base):
+    """Durable unit of ingestion work, claimed by worker processes under a lease"""
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(Integer, ForeignKey("knowledge_sources.id"), index=True)
+    kind = Column(String, nullable=False, default="ingest")  # 'ingest' or 'reingest'
+    payload = Column(JSON, nullable=True)  # e.g. the replacement file of a 'reingest' job
+    status = Column(String, nullable=False, default="queued")  # 'queued', 'running', 'succeeded', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(UTCDateTime, nullable=False)  # not claimed before this time (retry backoff)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(UTCDateTime, nullable=True)  # a crashed worker's job is reclaimed after this
+    stage = Column(String, nullable=True)  # 'download', 'extract', 'chunk', 'embed', 'done'
+    progress = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(UTCDateTime, nullable=True)
+    updated_at = Column(UTCDateTime, nullable=True)
+
+    source = relationship("KnowledgeSource")
+
+    __table_args__ = (
+        Index("ix_ingestion_jobs_status_run_after", "status", "run_after"),
+    )
+
 # Pydantic Models
 
 
@@ -60,6 +106,29 @@ class KnowledgeSourceResponse(KnowledgeSourceBase):
             datetime: lambda v: v.isoformat() if v.tzinfo else v.replace(tzinfo=timezone.utc).isoformat()
         }
 
+class IngestionJobResponse(BaseModel):
+    id: int
+    source_id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    stage: Optional[str]
+    progress: Optional[Dict[str, Any]]
+    last_error: Optional[str]
+    run_after: datetime
+    updated_at: Optional[datetime]
+
+    @field_validator('run_after', 'updated_at', mode='before')
+    @classmethod
+    def ensure_timezone_aware(cls, v):
+        if v and v.tzinfo is None:
+            return v.replace(tzinfo=timezone.utc)
+        return v
+
+    class Config:
+        from_attributes = True
+
 class KnowledgeSourceList(BaseModel):
     items: List[KnowledgeSourceResponse]
     total: int
\ No newline at end of file
@@ -2,74 +2,318 @@ from groq import Groq
 import os
 import logging
 import base64
+import codecs
+import subprocess
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
 from mistralai import Mistral
+from pypdf import PdfReader
 from app.config import settings
+from app.utils.provider_limits import provider_slot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def extract_text_from_document(file_path: str) -> str:
-    """Extract text from PDF or document files using Mistral OCR"""
+def count_pdf_pages(file_path: str) -> Optional[int]:
+    """Number of pages of a PDF, or None when it isn't a readable PDF"""
+    if not file_path.lower().endswith(".pdf"):
+        return None
     try:
-        # Check if file exists
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
+        return len(PdfReader(file_path).pages)
+    except Exception as e:
+        logger.warning(f"Could not read page count of {file_path}: {e}")
+        return None
 
-        # Initialize Mistral client
-        client = Mistral(api_key=settings.MISTRAL_API_KEY)
 
-        logger.info(f"Uploading document to Mistral OCR: {file_path}")
+def _page_text(page, text_only: bool) -> str:
+    # Add page markdown content
+    page_content = page.markdown + "\n\n"
+
+    # Reference images on the page by position (their pixels are never downloaded)
+    if not text_only and getattr(page, 'images', None):
+        for img_idx, image in enumerate(page.images):
+            img_ref = f"[IMAGE {img_idx+1} ON PAGE {page.index+1}] - Located at coordinates: " + \
+                f"({image.top_left_x}, {image.top_left_y}) to ({image.bottom_right_x}, {image.bottom_right_y})\n"
+            page_content += img_ref + "\n"
+    return page_content
+
 
+def iter_ocr_pages(file_path: str, pages: Optional[List[int]] = None,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Tuple[int, str]]:
+    """OCR a document with Mistral OCR, yielding (zero-based page index, text) in page order
+
+    PDFs are OCRed in page ranges of ``OCR_PAGES_PER_REQUEST`` pages, up to
+    ``OCR_MAX_CONCURRENCY`` at a time and never more than twice that many
+    ranges ahead of the consumer; ``pages`` restricts OCR to those pages.
+    ``progress(pages_done, total_pages)`` is called as ranges are consumed.
+    """
+    # Check if file exists
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    # Initialize Mistral client
+    client = Mistral(api_key=settings.MISTRAL_API_KEY)
+    text_only = settings.OCR_TEXT_ONLY
+
+    logger.info(f"Uploading document to Mistral OCR: {file_path}")
+
+    with provider_slot("mistral"):
         # Upload document to Mistral OCR
-        uploaded_file = client.files.upload(
-            file={
-                "file_name": os.path.basename(file_path),
-                "content": open(file_path, "rb"),
-            },
-            purpose="ocr"
-        )
+        with open(file_path, "rb") as content:
+            uploaded_file = client.files.upload(
+                file={
+                    "file_name": os.path.basename(file_path),
+                    "content": content,
+                },
+                purpose="ocr"
+            )
 
         # Retrieve the document URL from the uploaded file
         signed_url_obj = client.files.get_signed_url(file_id=uploaded_file.id)
         signed_url = signed_url_obj.url
 
-        if not signed_url:
-            raise ValueError(
-                "The retrieved file response does not contain a valid 'document_url'.")
+    if not signed_url:
+        raise ValueError(
+            "The retrieved file response does not contain a valid 'document_url'.")
+
+    def ocr(page_range: Optional[List[int]]) -> Dict[int, str]:
+        # Process OCR using the document URL; image payloads are never requested
+        options = {"pages": page_range} if page_range is not None else {}
+        if text_only:
+            options["image_limit"] = 0
+        started = time.perf_counter()
+        with provider_slot("mistral"):
+            response = client.ocr.process(
+                model=settings.OCR_MODEL,
+                document={"type": "document_url", "document_url": signed_url},
+                include_image_base64=False,
+                **options
+            )
+        if page_range is not None:
+            logger.info(
+                f"OCR of {len(page_range)} pages from page {page_range[0]+1} "
+                f"took {time.perf_counter() - started:.1f}s")
+        return {page.index: _page_text(page, text_only) for page in response.pages}
+
+    if pages is None:
+        total_pages = count_pdf_pages(file_path)
+        pages = list(range(total_pages)) if total_pages is not None else None
+    if pages is None:
+        # Page ranges need a page count; other formats go in one request
+        texts = ocr(None)
+        if progress:
+            progress(len(texts), len(texts))
+        for index in sorted(texts):
+            yield index, texts[index]
+        return
+
+    ranges = [pages[i:i + settings.OCR_PAGES_PER_REQUEST]
+              for i in range(0, len(pages), settings.OCR_PAGES_PER_REQUEST)]
+    ahead = 2 * settings.OCR_MAX_CONCURRENCY
+    window = deque()
+    submitted = 0
+    pages_done = 0
+    with ThreadPoolExecutor(max_workers=min(settings.OCR_MAX_CONCURRENCY, len(ranges)) or 1) as pool:
+        try:
+            while window or submitted < len(ranges):
+                while submitted < len(ranges) and len(window) < ahead:
+                    window.append((ranges[submitted], pool.submit(ocr, ranges[submitted])))
+                    submitted += 1
+                page_range, future = window.popleft()
+                texts = future.result()
+                pages_done += len(page_range)
+                if progress:
+                    progress(pages_done, len(pages))
+                for index in sorted(texts):
+                    yield index, texts[index]
+        finally:
+            # The consumer stopped early or a range failed: don't start what's still queued
+            for _, future in window:
+                future.cancel()
+
+
+def iter_document_pages(file_path: str,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Yield the text of a PDF or document page by page, OCRed with Mistral OCR"""
+    try:
+        characters = pages = 0
+        for _, text in iter_ocr_pages(file_path, progress=progress):
+            characters += len(text)
+            pages += 1
+            yield text
+        logger.info(
+            f"Extracted {characters} characters from {pages} pages")
 
-        # Process OCR using the document URL
-        ocr_response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document={"type": "document_url", "document_url": signed_url},
-            include_image_base64=True,
-        )
+    except Exception as e:
+        logger.error(f"Error extracting text from document: {str(e)}")
+        raise
+
+
+def _text_layer_usable(text: str, has_images: bool) -> bool:
+    """Whether a page's embedded text can stand in for OCR
+
+    Scanned pages have no text layer (or a few stray characters) over an
+    image; broken font encodings produce mostly symbols or U+FFFD.
+    """
+    stripped = "".join(text.split())
+    if len(stripped) < settings.LOCAL_PDF_MIN_CHARS_PER_PAGE:
+        # A short page without images (title, divider, blank) is what it looks like
+        return not has_images
+    readable = sum(1 for ch in stripped if ch.isalnum() or ch in ".,;:!?()[]{}'\"-/%&*+=<>@#$_")
+    return readable / len(stripped) >= settings.LOCAL_PDF_MIN_READABLE_RATIO
+
+
+def _page_has_images(page) -> bool:
+    try:
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources is not None else None
+        return bool(xobjects) and any(
+            xobject.get_object().get("/Subtype") == "/Image" for xobject in xobjects.get_object().values())
+    except Exception:
+        return True  # when unsure, let OCR look at it
+
+
+def _text_layer(page, file_path: str, index: int) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        logger.warning(f"Text layer of page {index+1} of {file_path} unreadable: {e}")
+        return ""
 
-        logger.info("Extracting text and image content from OCR response...")
-        all_text = ""
 
-        for page_idx, page in enumerate(ocr_response.pages):
-            # Add page markdown content
-            page_content = page.markdown + "\n\n"
+def iter_pdf_pages(file_path: str,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Yield the text of a PDF page by page, reading its embedded text layer where it is usable
+
+    Pages without a usable text layer (scans, broken font encodings) are
+    sent to Mistral OCR; everything else never leaves the machine. Pages
+    stream out as they are read until the first page that needs OCR; the
+    rest are then classified, their OCR is started and they follow in order.
+    ``progress(pages_done, total_pages)`` is called as pages are yielded.
+    """
+    try:
+        started = time.perf_counter()
+        reader = PdfReader(file_path)
+        total_pages = len(reader.pages)
+        ocr_pages = []
+        pages_done = characters = 0
+        slowest = (0.0, 0)
+        for index, page in enumerate(reader.pages):
+            page_started = time.perf_counter()
+            text = _text_layer(page, file_path, index)
+            usable = _text_layer_usable(text, _page_has_images(page))
+            elapsed = time.perf_counter() - page_started
+            slowest = max(slowest, (elapsed, index))
+            logger.debug(f"Page {index+1}/{total_pages} of {file_path}: {elapsed*1000:.1f} ms, "
+                         f"{'text layer' if usable else 'needs OCR'}")
+            if not usable:
+                ocr_pages.append(index)
+            elif not ocr_pages:
+                # Nothing before this page is waiting on OCR, so it can go straight out
+                pages_done += 1
+                characters += len(text)
+                yield text.strip() + "\n\n"
+                if progress:
+                    progress(pages_done, total_pages)
+        local_seconds = time.perf_counter() - started
+        logger.info(
+            f"Text layer of {file_path}: {total_pages - len(ocr_pages)}/{total_pages} pages usable "
+            f"in {local_seconds:.2f}s ({local_seconds * 1000 / max(total_pages, 1):.1f} ms/page, "
+            f"slowest page {slowest[1]+1} at {slowest[0]*1000:.1f} ms)")
+
+        if ocr_pages:
+            logger.info(f"Sending {len(ocr_pages)} pages of {file_path} to OCR: {[i + 1 for i in ocr_pages]}")
+            ocr_results = iter_ocr_pages(file_path, pages=ocr_pages)
+            needs_ocr = set(ocr_pages)
+            for index in range(ocr_pages[0], total_pages):
+                if index in needs_ocr:
+                    _, text = next(ocr_results)
+                else:
+                    # Text layers after the first scanned page are read again rather than held
+                    text = _text_layer(reader.pages[index], file_path, index).strip() + "\n\n"
+                pages_done += 1
+                characters += len(text)
+                yield text
+                if progress:
+                    progress(pages_done, total_pages)
 
-            # Process images on the page if any
-            if hasattr(page, 'images') and page.images:
-                for img_idx, image in enumerate(page.images):
-                    # Create image reference with position information
-                    img_ref = f"[IMAGE {img_idx+1} ON PAGE {page_idx+1}] - Located at coordinates: " + \
-                        f"({image.top_left_x}, {image.top_left_y}) to ({image.bottom_right_x}, {image.bottom_right_y})\n"
+        logger.info(
+            f"Extracted {characters} characters from {total_pages} pages "
+            f"({len(ocr_pages)} OCRed) in {time.perf_counter() - started:.2f}s")
 
-                    # Add image reference to the page content
-                    page_content += img_ref + "\n"
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {str(e)}")
+        raise
 
-            all_text += page_content
 
+_DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _docx_paragraph(paragraph) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == _DOCX_NS + "t" and node.text:
+            parts.append(node.text)
+        elif node.tag == _DOCX_NS + "tab":
+            parts.append("\t")
+        elif node.tag in (_DOCX_NS + "br", _DOCX_NS + "cr"):
+            parts.append("\n")
+    text = "".join(parts).strip()
+    style = paragraph.find(f"{_DOCX_NS}pPr/{_DOCX_NS}pStyle")
+    style_name = style.get(_DOCX_NS + "val", "") if style is not None else ""
+    if text and style_name.lower().startswith("heading") and style_name[7:].isdigit():
+        # Keep Word headings as markdown headings, like OCR output has them
+        text = "#" * min(int(style_name[7:]), 6) + " " + text
+    elif text and style_name.lower() == "title":
+        text = "# " + text
+    return text
+
+
+def iter_docx_blocks(file_path: str) -> Iterator[str]:
+    """Yield the paragraphs and table rows of a .docx file, parsing its XML incrementally
+
+    Paragraphs keep their order, Word heading styles become markdown
+    headings and table rows are joined with ``|``.
+    """
+    try:
+        started = time.perf_counter()
+        characters = 0
+        depth = 0
+        with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as document:
+            for event, element in ElementTree.iterparse(document, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 2:  # only direct children of <w:body>
+                    continue
+                if element.tag == _DOCX_NS + "p":
+                    text = _docx_paragraph(element)
+                    if text:
+                        characters += len(text) + 2
+                        yield text + "\n\n"
+                elif element.tag == _DOCX_NS + "tbl":
+                    for row in element.iter(_DOCX_NS + "tr"):
+                        cells = [
+                            " ".join(filter(None, (_docx_paragraph(p) for p in cell.iter(_DOCX_NS + "p"))))
+                            for cell in row.iter(_DOCX_NS + "tc")
+                        ]
+                        if any(cells):
+                            text = "| " + " | ".join(cells) + " |"
+                            characters += len(text) + 2
+                            yield text + "\n\n"
+                element.clear()
         logger.info(
-            f"Extracted {len(all_text)} characters from {len(ocr_response.pages)} pages")
-        return all_text
+            f"Extracted {characters} characters from {file_path} in {time.perf_counter() - started:.2f}s")
 
     except Exception as e:
-        logger.error(f"Error extracting text from document: {str(e)}")
+        logger.error(f"Error extracting text from .docx file: {e}")
         raise
 
 
@@ -101,13 +345,14 @@ def extract_text_from_image(file_path: str) -> str:
         logger.info(f"Uploading image to Mistral OCR: {file_path}")
 
         # Process OCR using Base64 encoded image
-        ocr_response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document={
-                "type": "image_url",
-                "image_url": f"data:image/jpeg;base64,{base64_image}"
-            }
-        )
+        with provider_slot("mistral"):
+            ocr_response = client.ocr.process(
+                model=settings.OCR_MODEL,
+                document={
+                    "type": "image_url",
+                    "image_url": f"data:image/jpeg;base64,{base64_image}"
+                }
+            )
 
         # Extract text from the OCR response
         extracted_text = ocr_response.pages[0].markdown if ocr_response.pages else ""
@@ -119,51 +364,166 @@ def extract_text_from_image(file_path: str) -> str:
         logger.error(f"Error extracting text from image: {e}")
         raise
 
-def extract_text_from_audio(file_path: str) -> str:
-    """Extract text from audio files using Groq API"""
+def probe_audio_duration(file_path: str) -> Optional[float]:
+    """Duration of an audio file in seconds, or None when ffprobe can't read it"""
     try:
-        import os
-        import json
-        from groq import Groq
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", file_path],
+            capture_output=True, text=True, timeout=60, check=True,
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not read duration of {file_path}: {e}")
+        return None
+
+
+def _audio_windows(duration: float, segment_seconds: int, overlap_seconds: int) -> List[tuple]:
+    """(owned_start, owned_end, cut_start, cut_end) per segment
+
+    Every second of the recording is owned by exactly one segment; each
+    segment is cut ``overlap_seconds`` wider on both sides so speech crossing
+    a boundary is heard whole by whichever segment owns it.
+    """
+    windows = []
+    start = 0.0
+    while start < duration:
+        end = min(start + segment_seconds, duration)
+        windows.append((start, end, max(start - overlap_seconds, 0.0), min(end + overlap_seconds, duration)))
+        start = end
+    return windows
+
+
+def _cut_audio(file_path: str, start: float, end: float, out_path: str):
+    # Mono 16 kHz FLAC is what Whisper resamples to anyway, and keeps segments small
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+         "-i", file_path, "-ac", "1", "-ar", "16000", "-c:a", "flac", out_path],
+        capture_output=True, timeout=600, check=True,
+    )
+
+
+def _segment_field(segment, name: str):
+    return segment[name] if isinstance(segment, dict) else getattr(segment, name)
+
+
+def _transcribe(client: Groq, file_path: str) -> tuple:
+    """Transcribe one file; returns (text, [(start, end, text), ...]) with file-relative times"""
+    with open(file_path, "rb") as audio_file, provider_slot("groq"):
+        transcription = client.audio.transcriptions.create(
+            file=audio_file,
+            model=settings.TRANSCRIPTION_MODEL,
+            prompt="Specify context or spelling",
+            response_format="verbose_json",
+            timestamp_granularities=["segment"],
+            language="id",
+            temperature=0.0
+        )
+    segments = [
+        (float(_segment_field(seg, "start")), float(_segment_field(seg, "end")),
+         _segment_field(seg, "text").strip())
+        for seg in (getattr(transcription, "segments", None) or [])
+    ]
+    return transcription.text or "", segments
+
+
+def transcribe_audio(file_path: str,
+                     progress: Optional[Callable[[int, int], None]] = None) -> List[dict]:
+    """Transcribe audio with Groq Whisper into timed segments
+
+    Recordings longer than ``TRANSCRIPTION_SEGMENT_SECONDS`` are cut with
+    ffmpeg into overlapping segments, transcribed up to
+    ``TRANSCRIPTION_MAX_CONCURRENCY`` at a time and stitched back in order.
+    Returns ``[{"start": s, "end": s, "text": ...}, ...]`` with times in
+    seconds from the start of the recording; ``progress(done, total)`` is
+    called as segments complete.
+    """
+    try:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
 
         # Initialize Groq client
         client = Groq()
-
-        logger.info(f"Transcribing audio file: {file_path}")
-
-        # Open the audio file
-        with open(file_path, "rb") as audio_file:
-            # Create a transcription of the audio file
-            transcription = client.audio.transcriptions.create(
-                file=audio_file,  # Required audio file
-                model="whisper-large-v3-turbo",  # Required model to use for transcription
-                prompt="Specify context or spelling",  
-                response_format="verbose_json", 
-                timestamp_granularities=["word", "segment"],  
-                language="id",  
-                temperature=0.0  
-            )
-
-        # Log the full transcription object
-        logger.info(f"Full transcription response: {json.dumps(transcription, indent=2, default=str)}")
-
-        # Extract the transcription text
-        transcription_text = transcription.text
-        if not transcription_text:
+        started = time.perf_counter()
+
+        duration = probe_audio_duration(file_path)
+        if duration is None or duration <= settings.TRANSCRIPTION_SEGMENT_SECONDS:
+            # Short (or unprobeable) recordings go in one request, as uploaded
+            text, timed = _transcribe(client, file_path)
+            if not timed and text.strip():
+                timed = [(0.0, duration or 0.0, text.strip())]
+            if progress:
+                progress(1, 1)
+        else:
+            windows = _audio_windows(
+                duration, settings.TRANSCRIPTION_SEGMENT_SECONDS, settings.TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS)
+            logger.info(f"Transcribing {duration:.0f}s of audio from {file_path} in {len(windows)} segments")
+
+            with tempfile.TemporaryDirectory(prefix="transcribe_") as work_dir:
+                def transcribe_window(index: int) -> list:
+                    owned_start, owned_end, cut_start, cut_end = windows[index]
+                    segment_started = time.perf_counter()
+                    segment_path = os.path.join(work_dir, f"segment_{index:04d}.flac")
+                    _cut_audio(file_path, cut_start, cut_end, segment_path)
+                    cut_seconds = time.perf_counter() - segment_started
+                    _, timed = _transcribe(client, segment_path)
+                    os.unlink(segment_path)
+                    # Keep only speech centred in this segment's own span; the overlap belongs to its neighbours
+                    last = index == len(windows) - 1
+                    kept = []
+                    for seg_start, seg_end, seg_text in timed:
+                        start, end = seg_start + cut_start, seg_end + cut_start
+                        middle = (start + end) / 2
+                        if seg_text and middle >= owned_start and (middle < owned_end or last):
+                            kept.append((start, end, seg_text))
+                    logger.info(
+                        f"Audio segment {index+1}/{len(windows)} ({owned_start:.0f}-{owned_end:.0f}s): "
+                        f"cut {cut_seconds:.1f}s, transcribed {time.perf_counter() - segment_started - cut_seconds:.1f}s, "
+                        f"{len(kept)}/{len(timed)} segments kept")
+                    return kept
+
+                results = [None] * len(windows)
+                done = 0
+                with ThreadPoolExecutor(
+                        max_workers=min(settings.TRANSCRIPTION_MAX_CONCURRENCY, len(windows))) as pool:
+                    futures = {pool.submit(transcribe_window, i): i for i in range(len(windows))}
+                    for future in as_completed(futures):
+                        results[futures[future]] = future.result()
+                        done += 1
+                        if progress:
+                            progress(done, len(windows))
+            timed = [segment for window in results for segment in window]
+
+        if not timed:
             raise ValueError("No transcription text found in the response.")
 
-        logger.info(f"Transcribed {len(transcription_text)} characters from audio")
-        return transcription_text
+        characters = sum(len(text) for _, _, text in timed)
+        logger.info(
+            f"Transcribed {characters} characters in {len(timed)} segments from "
+            f"{duration or 0:.0f}s of audio in {time.perf_counter() - started:.1f}s")
+        return [{"start": round(start, 2), "end": round(end, 2), "text": text} for start, end, text in timed]
 
     except Exception as e:
         logger.error(f"Error extracting text from audio: {str(e)}")
         raise
 
-def extract_text_from_txt(file_path: str) -> str:
-    """Extract text from .txt files."""
+
+def iter_txt_blocks(file_path: str, block_size: int = 1024 * 1024) -> Iterator[str]:
+    """Yield a .txt file in decoded blocks (UTF-8, with or without BOM, or Windows-1252)"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
+        # Check the whole file decodes as UTF-8 before committing to it
+        encoding = 'utf-8-sig'
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with open(file_path, 'rb') as file:
+            try:
+                for block in iter(lambda: file.read(block_size), b''):
+                    decoder.decode(block)
+                decoder.decode(b'', final=True)
+            except UnicodeDecodeError:
+                encoding = 'cp1252'
+        with open(file_path, 'r', encoding=encoding, errors='replace') as file:
+            for block in iter(lambda: file.read(block_size), ''):
+                yield block
     except Exception as e:
         logger.error(f"Error extracting text from .txt file: {e}")
-        raise
\ No newline at end of file
+        raise
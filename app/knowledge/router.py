@@ -1,19 +1,26 @@
+import asyncio
 import logging
 import os
-import shutil
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi.background import BackgroundTasks
 from fastapi.responses import FileResponse, StreamingResponse, RedirectResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List
-from app.vector_store.pinecone_client import get_vector_store
+from app.vector_store.pinecone_client import delete_source_vectors
 from app.auth.dependencies import get_current_admin, get_current_user
 from app.database import get_db
-from app.knowledge.models import KnowledgeSource, KnowledgeSourceResponse, KnowledgeSourceList
-from app.knowledge.service import process_knowledge_source
+from app.knowledge.models import (
+    KnowledgeSource, KnowledgeSourceResponse, KnowledgeSourceList, KnowledgeChunk,
+    IngestionJob, IngestionJobResponse
+)
+from app.knowledge.jobs import enqueue_job
+from app.knowledge.corpus import bump_corpus_version
 from app.users.models import User
 from app.config import settings
 from app.storage.spaces_storage import SpacesStorage  # Import SpacesStorage
+from app.storage.uploads import LocalUploadWriter, SpacesUploadWriter, delete_stored_file, receive_upload
 import mimetypes
 import tempfile
 from slowapi import Limiter
@@ -33,110 +40,112 @@ app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
 
-@router.post("/upload", response_model=KnowledgeSourceResponse)
-async def upload_knowledge_source(
-    background_tasks: BackgroundTasks,
-    title: str = Form(...),
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-     # Log file details
-    logging.info(f"Received file: {file.filename}")
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    logging.info(f"File extension: {file_extension}")
-
+def _file_type_for(file_extension: str) -> str:
     if file_extension in ['.pdf', '.docx', '.doc', '.txt']:
-        file_type = 'document'
+        return 'document'
     elif file_extension in ['.jpg', '.jpeg', '.png']:
-        file_type = 'image'
+        return 'image'
     elif file_extension in ['.mp3', '.wav', '.m4a']:
-        file_type = 'audio'
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail="Unsupported file type. Supported types: PDF, DOCX, TXT, JPG/JPEG, PNG, MP3, WAV, M4A."
-        )
-
-    # Get file size (in bytes)
-    file.file.seek(0, 2)  # Move to end of file
-    file_size = file.file.tell()  # Get current position
-    file.file.seek(0)  # Reset to beginning of file
+        return 'audio'
+    raise HTTPException(
+        status_code=400,
+        detail="Unsupported file type. Supported types: PDF, DOCX, TXT, JPG/JPEG, PNG, MP3, WAV, M4A."
+    )
 
-    max_size_mb = 30 
-    max_size_bytes = max_size_mb * 1024 * 1024
 
-    if file_size > max_size_bytes:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File size exceeds the limit of {max_size_mb} MB"
-        )
+def _upload_writer(file_name: str):
+    if settings.USE_SPACES:
+        return SpacesUploadWriter(f"knowledge/{uuid.uuid4().hex}/{file_name}", settings.UPLOAD_PART_SIZE)
+    # A directory per upload, so a same-titled upload never overwrites a stored file
+    return LocalUploadWriter(os.path.join(settings.UPLOAD_DIR, uuid.uuid4().hex, file_name))
 
-    # Create directory if it doesn't exist
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
-    # Save file
-    local_file_path = os.path.join(settings.UPLOAD_DIR, f"{title}{file_extension}")
+def _find_by_hash(db: Session, content_hash: str):
+    return db.query(KnowledgeSource).filter(
+        KnowledgeSource.content_hash == content_hash).first()
 
-    with open(local_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
 
-    # Get current UTC time
-    current_utc = datetime.now(timezone.utc)
-    
-    # Create database entry
-    db_knowledge = KnowledgeSource(
-        title=title,
-        file_path=local_file_path,
-        file_type=file_type,
-        uploaded_by=current_user.id,
-        created_at=current_utc
+def _duplicate_error(duplicate: KnowledgeSource) -> HTTPException:
+    logging.info(f"Rejected duplicate upload of knowledge source {duplicate.id} ({duplicate.content_hash})")
+    return HTTPException(
+        status_code=409,
+        detail={
+            "message": "This file has already been uploaded",
+            "existing_source_id": duplicate.id,
+            "existing_title": duplicate.title,
+            "existing_status": duplicate.status,
+        }
     )
 
-    db.add(db_knowledge)
-    db.commit()
-    db.refresh(db_knowledge)
-
-    # If USE_SPACES is enabled, upload to DigitalOcean Spaces
-    file_url = local_file_path
-    if True:
-        try:
-            spaces = SpacesStorage()
-            # PERBAIKAN: Hapus "skripsia-uploads/" dari object_name karena sudah ada di bucket name
-            object_name = f"knowledge/{db_knowledge.id}/{title}{file_extension}"
-
-            # Logging akan membantu debugging
-            logging.info(f"Uploading to Spaces with object_name: {object_name}")
-
-            # Upload file
-            space_object_name = spaces.upload_file(local_file_path, object_name)
 
-            if space_object_name:
-                # Generate public URL for the file
-                public_url = spaces.get_public_url(space_object_name)
+def _multipart_body(*fields: str) -> dict:
+    # The body is parsed from the request stream, so describe the form for the OpenAPI docs by hand
+    properties = {name: {"type": "string"} for name in fields}
+    properties["file"] = {"type": "string", "format": "binary"}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "properties": properties, "required": [*fields, "file"]}}}}}
 
-                # Update database with the object path and public URL
-                db_knowledge.file_path = space_object_name
-                db_knowledge.public_url = public_url
-                db.commit()
-                db.refresh(db_knowledge)
 
-                # We can now remove the local file
-                os.remove(local_file_path)
-                logging.info(f"File uploaded to Spaces and local file removed. Path in DB: {db_knowledge.file_path}, Public URL: {db_knowledge.public_url}")
-            else:
-                logging.error("Failed to upload file to Spaces")
-        except Exception as e:
-            logging.error(f"Error uploading to Spaces: {e}")
-            # If Spaces upload fails, continue with local file
-
-    # Process knowledge source in background
-    background_tasks.add_task(
-        process_knowledge_source,
-        db_knowledge.id,
-        db_knowledge.file_path,  # Gunakan path yang tersimpan di database
-        file_type
-    )
+@router.post("/upload", response_model=KnowledgeSourceResponse, openapi_extra=_multipart_body("title"))
+async def upload_knowledge_source(
+    request: Request,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Upload a knowledge source; the ``title`` field must come before ``file`` in the form"""
+    file_name = None
+    file_type = None
+
+    def open_writer(filename: str, fields: dict):
+        nonlocal file_name, file_type
+        if not fields.get("title"):
+            raise HTTPException(status_code=400, detail="The 'title' field must be sent before the file")
+        # Log file details
+        logging.info(f"Received file: {filename}")
+        file_extension = os.path.splitext(filename)[1].lower()
+        logging.info(f"File extension: {file_extension}")
+        file_type = _file_type_for(file_extension)
+        file_name = f"{fields['title']}{file_extension}"
+        return _upload_writer(file_name)
+
+    # Stream the upload straight to storage, hashing it and checking the size as it arrives
+    received = await receive_upload(request, "file", open_writer, settings.UPLOAD_MAX_SIZE_MB * 1024 * 1024)
+    stored = received.stored
+    title = received.fields["title"]
+    logging.info(f"Stored {received.filename} at {stored.location} ({stored.size} bytes, sha256 {stored.sha256})")
+
+    def create_source():
+        # Create database entry and queue processing for the ingestion workers
+        # (python -m app.knowledge.worker) in one transaction
+        db_knowledge = KnowledgeSource(
+            title=title,
+            file_path=stored.location,
+            file_type=file_type,
+            uploaded_by=current_user.id,
+            created_at=datetime.now(timezone.utc),
+            content_hash=stored.sha256
+        )
+        db.add(db_knowledge)
+        try:
+            db.flush()
+        except IntegrityError:
+            # An identical file was uploaded concurrently; the unique index caught it
+            db.rollback()
+            return None
+        enqueue_job(db, db_knowledge.id)
+        db.commit()
+        db.refresh(db_knowledge)
+        return db_knowledge
+
+    # Identical files are never processed twice: point to the existing source instead
+    duplicate = await asyncio.to_thread(_find_by_hash, db, stored.sha256)
+    db_knowledge = None if duplicate else await asyncio.to_thread(create_source)
+    if db_knowledge is None:
+        duplicate = duplicate or await asyncio.to_thread(_find_by_hash, db, stored.sha256)
+        await asyncio.to_thread(delete_stored_file, stored.location)
+        if duplicate is None:
+            raise HTTPException(status_code=409, detail="An identical upload is in progress, please retry")
+        raise _duplicate_error(duplicate)
 
      # Convert SQLAlchemy object to Pydantic model
     return KnowledgeSourceResponse(
@@ -145,10 +154,65 @@ async def upload_knowledge_source(
         file_type=db_knowledge.file_type,
         status=db_knowledge.status,
         created_at=db_knowledge.created_at,
-        file_name=title + file_extension
+        file_name=file_name
     )
 
 
+@router.put("/{knowledge_id}/file", response_model=IngestionJobResponse, status_code=202,
+            openapi_extra=_multipart_body())
+async def replace_knowledge_file(
+    knowledge_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Replace the file of a knowledge source and re-ingest only the chunks that changed
+
+    The current version stays searchable until the worker swaps in the new one.
+    """
+    knowledge = await asyncio.to_thread(
+        lambda: db.query(KnowledgeSource).filter(KnowledgeSource.id == knowledge_id).first())
+    if not knowledge:
+        raise HTTPException(
+            status_code=404, detail="Knowledge source not found")
+
+    pending = await asyncio.to_thread(lambda: db.query(IngestionJob).filter(
+        IngestionJob.source_id == knowledge_id,
+        IngestionJob.status.in_(["queued", "running"])
+    ).first())
+    if pending:
+        raise HTTPException(
+            status_code=409, detail="This knowledge source is still being processed")
+
+    def open_writer(filename: str, fields: dict):
+        file_extension = os.path.splitext(filename)[1].lower()
+        if _file_type_for(file_extension) != knowledge.file_type:
+            raise HTTPException(
+                status_code=400,
+                detail=f"The replacement must be a {knowledge.file_type} file")
+        return _upload_writer(f"{knowledge.title}{file_extension}")
+
+    received = await receive_upload(request, "file", open_writer, settings.UPLOAD_MAX_SIZE_MB * 1024 * 1024)
+    stored = received.stored
+    logging.info(f"Stored replacement for source {knowledge_id} at {stored.location} ({stored.size} bytes)")
+
+    duplicate = await asyncio.to_thread(_find_by_hash, db, stored.sha256)
+    if duplicate:
+        await asyncio.to_thread(delete_stored_file, stored.location)
+        raise _duplicate_error(duplicate)
+
+    def create_job():
+        job = enqueue_job(db, knowledge_id, kind="reingest", payload={
+            "file_path": stored.location,
+            "content_hash": stored.sha256,
+        })
+        db.commit()
+        db.refresh(job)
+        return job
+
+    return await asyncio.to_thread(create_job)
+
+
 @router.get("/", response_model=KnowledgeSourceList)
 async def list_knowledge_sources(
     skip: int = 0,
@@ -190,6 +254,23 @@ async def get_knowledge_source(
     return knowledge
 
 
+@router.get("/{knowledge_id}/job", response_model=IngestionJobResponse)
+async def get_ingestion_job(
+    knowledge_id: int,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Latest ingestion job of a knowledge source, with its stage and progress"""
+    job = db.query(IngestionJob).filter(
+        IngestionJob.source_id == knowledge_id
+    ).order_by(IngestionJob.id.desc()).first()
+    if not job:
+        raise HTTPException(
+            status_code=404, detail="No ingestion job found for this knowledge source")
+
+    return job
+
+
 @router.delete("/{knowledge_id}", status_code=200)
 async def delete_knowledge_source(
     knowledge_id: int,
@@ -213,16 +294,33 @@ async def delete_knowledge_source(
     # Else delete local file if it exists
     elif os.path.exists(knowledge.file_path):
         os.remove(knowledge.file_path)
+        upload_dir = os.path.dirname(knowledge.file_path)
+        if os.path.abspath(upload_dir) != os.path.abspath(settings.UPLOAD_DIR) and not os.listdir(upload_dir):
+            os.rmdir(upload_dir)
+
+    # Replacement files of pending re-ingestions will never be swapped in now
+    pending_reingests = db.query(IngestionJob).filter(
+        IngestionJob.source_id == knowledge_id,
+        IngestionJob.kind == "reingest",
+        IngestionJob.status.in_(["queued", "running"])
+    ).all()
+    for job in pending_reingests:
+        try:
+            delete_stored_file(job.payload["file_path"])
+        except Exception as e:
+            logging.error(f"Failed to delete replacement file of job {job.id}: {e}")
 
     # Delete related vectors from Pinecone
-    vector_store = get_vector_store()
     try:
-        vector_store._index.delete(filter={"source_id": knowledge_id})
+        delete_source_vectors(knowledge_id)
     except Exception as e:
         logging.error(f"Failed to delete vectors from Pinecone: {e}")
 
-    # Delete the knowledge source from the database
+    # Delete the knowledge source, its chunk manifest and ingestion jobs from the database
+    db.query(IngestionJob).filter(IngestionJob.source_id == knowledge_id).delete()
+    db.query(KnowledgeChunk).filter(KnowledgeChunk.source_id == knowledge_id).delete()
     db.delete(knowledge)
+    bump_corpus_version(db)
     db.commit()
 
     return {"detail": "Knowledge source deleted successfully"}
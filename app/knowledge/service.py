@@ -1,22 +1,329 @@
+import json
 import logging
 from sqlalchemy.orm import Session
 import os
+import re
 import tempfile
+import time
+from bisect import bisect_right
+from contextlib import closing
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 from app.database import SessionLocal
-from app.knowledge.models import KnowledgeSource
-from app.knowledge.processor import extract_text_from_document, extract_text_from_image, extract_text_from_audio, extract_text_from_txt
-from app.vector_store.pinecone_client import store_chunks_in_pinecone
+from app.knowledge.corpus import bump_corpus_version
+from app.knowledge.extraction_cache import extract_with_cache, stream_with_cache
+from app.knowledge.models import IngestionJob, KnowledgeChunk, KnowledgeSource
+from app.knowledge.processor import (
+    extract_text_from_image, iter_docx_blocks, iter_document_pages, iter_pdf_pages, iter_txt_blocks,
+    transcribe_audio
+)
+from app.vector_store.chunk_cache import content_hash as chunk_content_hash
+from app.vector_store.lexical_index import get_lexical_index
+from app.vector_store.pinecone_client import delete_chunk_vectors, fetch_chunks, stream_chunks_to_pinecone
 from app.config import settings
 from app.storage.spaces_storage import SpacesStorage  # Import SpacesStorage
+from app.storage.uploads import delete_stored_file
+from app.utils.tokens import count_tokens
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def process_knowledge_source(source_id: int, file_path: str, file_type: str):
-    """Process knowledge source file and store in vector database"""
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+
+def split_into_chunks(text: str) -> List[str]:
+    """Split text into chunks of at most ``CHUNK_TOKENS`` embedding-model tokens"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_TOKENS,
+        chunk_overlap=settings.CHUNK_OVERLAP_TOKENS,
+        length_function=count_tokens,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    return text_splitter.split_text(text)
+
+
+def _has_body(text: str) -> bool:
+    """Whether text holds anything besides markdown headings"""
+    return any(line.strip() and not _HEADING.match(line) for line in text.split("\n"))
+
+
+def _section_metadata(path: Tuple[str, ...]) -> dict:
+    return {"section_path": " > ".join(path)} if path else {}
+
+
+def _common_prefix(a: Tuple[str, ...], b: Tuple[str, ...]) -> Tuple[str, ...]:
+    n = 0
+    while n < min(len(a), len(b)) and a[n] == b[n]:
+        n += 1
+    return a[:n]
+
+
+class _SectionChunker:
+    """Turns markdown lines into (chunk, metadata) pairs along the heading structure
+
+    A heading closes the current section once it has body text; headings
+    with nothing under them yet are carried into the next section's first
+    chunk, so no chunk is only headings. A section that fits in one chunk
+    is merged with its small neighbours under the same heading, up to
+    ``CHUNK_TOKENS``. Longer sections are split with ``CHUNK_OVERLAP_TOKENS``
+    of overlap. Sections never overlap each other. A section that outgrows
+    ``window`` characters has its leading chunks split off early, so only
+    one window of text is held.
+    """
+
+    def __init__(self):
+        self.limit = settings.CHUNK_TOKENS
+        self.window = settings.CHUNK_TOKENS * 32
+        self.headings: List[Tuple[int, str]] = []
+        self.lines: List[str] = []
+        self.chars = 0
+        self.has_body = False
+        self.split_off = False
+        self.merged = ""
+        self.merged_tokens = 0
+        self.merged_path: Optional[Tuple[str, ...]] = None
+
+    @property
+    def path(self) -> Tuple[str, ...]:
+        return tuple(title for _, title in self.headings)
+
+    def add_line(self, line: str) -> List[Tuple[str, dict]]:
+        out = []
+        match = _HEADING.match(line)
+        if match:
+            if self.has_body:
+                out += self._end_section()
+            level = len(match.group(1))
+            while self.headings and self.headings[-1][0] >= level:
+                self.headings.pop()
+            self.headings.append((level, match.group(2)))
+        elif line.strip():
+            self.has_body = True
+        self.lines.append(line)
+        self.chars += len(line) + 1
+        if self.chars >= self.window:
+            out += self._split_off_leading_chunks()
+        return out
+
+    def finish(self) -> List[Tuple[str, dict]]:
+        return self._end_section() + self._flush_merged()
+
+    def _split_off_leading_chunks(self) -> List[Tuple[str, dict]]:
+        text = "\n".join(self.lines)
+        chunks = split_into_chunks(text)
+        if len(chunks) < 2:
+            return []
+        # Keep the last chunk's text so the next split overlaps it as usual
+        tail = text[text.rfind(chunks[-1]):]
+        self.lines = [tail]
+        self.chars = len(tail)
+        self.split_off = True
+        return self._flush_merged() + [
+            (chunk, _section_metadata(self.path)) for chunk in chunks[:-1] if _has_body(chunk)]
+
+    def _end_section(self) -> List[Tuple[str, dict]]:
+        text = "\n".join(self.lines).strip()
+        split_off, has_body = self.split_off, self.has_body
+        self.lines, self.chars, self.split_off, self.has_body = [], 0, False, False
+        if not has_body:
+            return []  # only headings, with nothing after them in the document
+        chunks = [chunk for chunk in split_into_chunks(text) if _has_body(chunk)]
+        if len(chunks) == 1 and not split_off:
+            return self._merge(chunks[0], self.path)
+        return self._flush_merged() + [(chunk, _section_metadata(self.path)) for chunk in chunks]
+
+    def _merge(self, text: str, path: Tuple[str, ...]) -> List[Tuple[str, dict]]:
+        out = []
+        tokens = count_tokens(text)
+        if self.merged_path is not None:
+            shared = _common_prefix(self.merged_path, path)
+            same_part = bool(shared) or self.merged_path == path
+            if same_part and self.merged_tokens + tokens + 1 <= self.limit:
+                self.merged += "\n\n" + text
+                self.merged_tokens += tokens + 1
+                self.merged_path = shared
+                return out
+            out = self._flush_merged()
+        self.merged, self.merged_tokens, self.merged_path = text, tokens, path
+        return out
+
+    def _flush_merged(self) -> List[Tuple[str, dict]]:
+        if self.merged_path is None:
+            return []
+        out = [(self.merged, _section_metadata(self.merged_path))]
+        self.merged, self.merged_tokens, self.merged_path = "", 0, None
+        return out
+
+
+def iter_chunks(pieces: Iterable[str]) -> Iterator[Tuple[str, dict]]:
+    """Split streamed markdown (pages, blocks) into token-sized chunks along its sections
+
+    Yields ``(chunk, metadata)``, where metadata holds the ``section_path`` of
+    headings the chunk falls under (e.g. ``"BAB III > 3.2 Format Penulisan"``).
+    """
+    chunker = _SectionChunker()
+    rest = ""
+    for piece in pieces:
+        rest += piece
+        *lines, rest = rest.split("\n")
+        for line in lines:
+            yield from chunker.add_line(line)
+    if rest:
+        yield from chunker.add_line(rest)
+    yield from chunker.finish()
+
+
+def split_transcript_into_chunks(segments: List[dict]) -> List[Tuple[str, dict]]:
+    """Split a timed transcript like any other text, tagging each chunk with the time span it covers"""
+    text = ""
+    offsets = []
+    for segment in segments:
+        if text:
+            text += "\n"
+        offsets.append(len(text))
+        text += segment["text"]
+
+    timed_chunks = []
+    cursor = 0
+    for chunk in split_into_chunks(text):
+        position = text.find(chunk, cursor)
+        if position < 0:
+            position = text.find(chunk)
+        cursor = position + 1
+        first = bisect_right(offsets, position) - 1
+        last = bisect_right(offsets, position + len(chunk) - 1) - 1
+        timed_chunks.append((chunk, {
+            "start_seconds": segments[first]["start"],
+            "end_seconds": segments[last]["end"],
+        }))
+    return timed_chunks
+
+
+def chunk_id(source_id: int, chunk_hash: str) -> str:
+    """Vector id derived from the chunk's content, so unchanged chunks keep their id"""
+    return f"source_{source_id}_{chunk_hash[:16]}"
+
+
+def _discard_vectors(source_id: int, ids: Iterable[str]):
+    """Delete vectors this run wrote that no manifest refers to, without masking the original error"""
+    ids = sorted(ids)
+    if not ids:
+        return
+    try:
+        delete_chunk_vectors(ids=ids)
+        logger.info(f"Removed {len(ids)} unreferenced vectors of knowledge source {source_id}")
+    except Exception as e:
+        logger.error(f"Failed to remove {len(ids)} unreferenced vectors of knowledge source {source_id}: {e}")
+
+
+def sync_lexical_index() -> dict:
+    """Bring the BM25 index in line with the chunk manifests
+
+    The lexical index is only written while hybrid retrieval is on, so after
+    switching it on, chunks stored in the meantime are fetched from the
+    vector store and added, and chunks deleted in the meantime are removed.
+    Sources still being ingested are left alone; their worker keeps the
+    index current.
+    """
+    with SessionLocal() as db:
+        stored = {chunk_id for (chunk_id,) in db.query(KnowledgeChunk.id)}
+        busy = {source_id for (source_id,) in db.query(IngestionJob.source_id).filter(
+            IngestionJob.status.in_(["queued", "running"]))}
+    lexical_index = get_lexical_index()
+    indexed = lexical_index.ids()
+    missing = sorted(stored - indexed)
+    stale = sorted(
+        doc_id for doc_id in indexed - stored
+        if (lexical_index.get(doc_id) or {}).get("metadata", {}).get("source_id") not in busy
+    )
+    added = 0
+    if missing:
+        docs = fetch_chunks(missing)
+        lexical_index.add([doc.id for doc in docs], [doc.page_content for doc in docs],
+                          [doc.metadata for doc in docs])
+        added = len(docs)
+    if stale:
+        lexical_index.remove(ids=stale)
+    if added or stale:
+        logger.info(f"Synced lexical index: added {added} chunks, removed {len(stale)}")
+    return {"added": added, "removed": len(stale)}
+
+
+def _throttled(report: Callable[[str, dict], None], interval: float = 1.0) -> Callable[[str, dict], None]:
+    """Pass progress on at most once per ``interval`` seconds"""
+    last = [0.0]
+
+    def call(stage: str, progress: dict):
+        now = time.monotonic()
+        if now - last[0] >= interval:
+            last[0] = now
+            report(stage, progress)
+    return call
+
+
+def _extracted_text(local_file_path: str, file_path: str, file_type: str,
+                    progress: Callable[[int, int], None]) -> Iterator[str]:
+    """Stream a file's text page by page (or block by block) from the extractor its type needs
+
+    OCR and transcription results are cached by file hash, so retries skip them.
+    """
+    extension = os.path.splitext(local_file_path)[1].lower()
+    ocr_extractor = "mistral_ocr_text_only" if settings.OCR_TEXT_ONLY else "mistral_ocr"
+    if file_type == "image":
+        yield extract_with_cache(
+            local_file_path, "mistral_ocr_image", settings.OCR_MODEL,
+            lambda: extract_text_from_image(local_file_path))
+        return
+    if file_type != "document":
+        return
+    if extension == '.txt':
+        yield from iter_txt_blocks(local_file_path)
+        return
+
+    found = False
+    if extension == '.docx' and settings.LOCAL_EXTRACTION_ENABLED:
+        for block in iter_docx_blocks(local_file_path):
+            found = True
+            yield block
+    elif extension == '.pdf' and settings.LOCAL_EXTRACTION_ENABLED:
+        # Only pages without a usable text layer are OCRed (and cached)
+        with closing(stream_with_cache(
+                local_file_path, "pdf_text_layer+" + ocr_extractor, settings.OCR_MODEL,
+                lambda: iter_pdf_pages(local_file_path, progress=progress))) as pdf_pages:
+            for page in pdf_pages:
+                found = found or bool(page.strip())
+                yield page
+    if found:
+        return
+    if extension in ('.docx', '.pdf') and settings.LOCAL_EXTRACTION_ENABLED:
+        logger.info(f"No text found locally in {file_path}; falling back to OCR")
+    yield from stream_with_cache(
+        local_file_path, ocr_extractor, settings.OCR_MODEL,
+        lambda: iter_document_pages(local_file_path, progress=progress))
+
+
+def process_knowledge_source(source_id: int, file_path: str, file_type: str,
+                             report: Optional[Callable[[str, dict], None]] = None,
+                             content_hash: Optional[str] = None):
+    """Process knowledge source file and store in vector database
+
+    Extraction, chunking, embedding and upserts are pipelined: pages stream
+    out of the extractor into the chunker and on through the ingestion
+    writer's bounded queues, so memory stays flat for large documents.
+
+    Also used to replace the file of an existing source: chunks are diffed
+    against the stored manifest, only new chunks are embedded and upserted,
+    and vanished ones are deleted just before the swap commits, so the old
+    version stays searchable until the new one is fully stored.
+
+    Raises on failure so the job queue can retry; ``report(stage, progress)``
+    is called as the work moves through its stages.
+    """
+    report = report or (lambda stage, progress: None)
     temp_file = None
+    stored_ids = set()
+    sent = set()  # ids handed to the writer in this run, written or possibly written
     try:
         logger.info(
             f"Processing knowledge source {source_id} of type {file_type}")
@@ -24,6 +331,7 @@ def process_knowledge_source(source_id: int, file_path: str, file_type: str):
         # Check if we need to download from Spaces
         local_file_path = file_path
         if settings.USE_SPACES and not file_path.startswith(settings.UPLOAD_DIR):
+            report("download", {"file": file_path})
             # For Spaces, file_path might be a URL or object name
             # Create a temporary file for processing
             file_name = os.path.basename(file_path)
@@ -37,67 +345,133 @@ def process_knowledge_source(source_id: int, file_path: str, file_type: str):
             else:
                 raise ValueError(f"Failed to download file from Spaces: {file_path}")
 
-        # Extract text based on file type
-        text = ""
-        if file_type == "document":
-            if local_file_path.endswith('.txt'):
-                text = extract_text_from_txt(local_file_path)
-            else:
-                text = extract_text_from_document(local_file_path)
-        elif file_type == "image":
-            text = extract_text_from_image(local_file_path)
-        elif file_type == "audio":
-            text = extract_text_from_audio(local_file_path)
+        with SessionLocal() as db:
+            knowledge_source = db.query(KnowledgeSource).filter(
+                KnowledgeSource.id == source_id).first()
+            if not knowledge_source:
+                logger.error(f"Knowledge source {source_id} not found in DB")
+                return
+            previous_file_path = knowledge_source.file_path
+            stored_ids = {
+                row.id for row in db.query(KnowledgeChunk.id).filter(KnowledgeChunk.source_id == source_id)
+            }
 
-        if not text:
-            raise ValueError(f"No text extracted from file: {file_path}")
+        file_name = os.path.basename(file_path)
+        progress = {"file_type": file_type}
+        report_throttled = _throttled(report)
 
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        def page_progress(done: int, total: int):
+            progress.update(pages_done=done, pages_total=total)
+            report_throttled("extract", dict(progress))
 
-        chunks = text_splitter.split_text(text)
-        logger.info(f"Split text into {len(chunks)} chunks")
+        # Extract, chunk, embed and upsert run as one pipeline, so the whole
+        # text is never held in memory and chunks become searchable as they go
+        report("extract", dict(progress))
+        started = time.perf_counter()
+        pages = None
+        if file_type == "audio":
+            segments = json.loads(extract_with_cache(
+                local_file_path, "groq_transcription_segments", settings.TRANSCRIPTION_MODEL,
+                lambda: json.dumps(transcribe_audio(
+                    local_file_path,
+                    progress=lambda done, total: report("extract", {"segments_done": done, "segments_total": total})))))
+            # Transcript chunks carry the time span they cover, so answers can cite it
+            chunk_stream = split_transcript_into_chunks(segments)
+        else:
+            # Document chunks follow the heading structure and carry their section path
+            pages = _extracted_text(local_file_path, file_path, file_type, page_progress)
+            chunk_stream = iter_chunks(pages)
 
-        # Prepare metadata
-        file_name = os.path.basename(file_path)
-        metadata = [{"source": file_name, "source_id": source_id, "chunk": i}
-                    for i in range(len(chunks))]
+        # Unchanged chunks are already in the index under the same id; a renamed
+        # file changes every chunk's 'source' metadata, and a re-cut recording
+        # may shift every chunk's timestamps, so then all are rewritten
+        renamed = os.path.basename(previous_file_path or "") != file_name
+        rewrite_all = renamed or file_type == "audio"
+        ids: List[str] = []
+        hashes: List[str] = []
+        seen = set()
+
+        def records():
+            for chunk, extra in chunk_stream:
+                chunk_hash = chunk_content_hash(chunk)
+                if chunk_hash in seen:
+                    continue  # identical chunks are stored once
+                seen.add(chunk_hash)
+                id_ = chunk_id(source_id, chunk_hash)
+                index = len(ids)
+                ids.append(id_)
+                hashes.append(chunk_hash)
+                if rewrite_all or id_ not in stored_ids:
+                    sent.add(id_)
+                    yield chunk, {"source": file_name, "source_id": source_id, "chunk": index,
+                                  "chunk_hash": chunk_hash, **extra}, id_
+
+        def batch_progress(queued: int, written: int):
+            progress.update(chunks=len(ids), new_chunks=queued, written=written)
+            report_throttled("extract", dict(progress))
+
+        # Store in vector database (batched, concurrent, retried per batch)
+        try:
+            stats = stream_chunks_to_pinecone(records(), source_id=source_id, on_batch=batch_progress)
+        finally:
+            if pages is not None:
+                # A writer that gave up leaves extraction mid-document; closing it
+                # lets the extraction cache finish the rest for the retry
+                pages.close()
+        if not ids:
+            raise ValueError(f"No text extracted from file: {file_path}")
+        logger.info(
+            f"Stored {stats['chunks']} of {len(ids)} chunks for source {source_id} "
+            f"at {stats['chunks_per_sec']} chunks/sec in {time.perf_counter() - started:.1f}s")
+        report("embed", {**stats, "new_chunks": stats["chunks"], "total_chunks": len(ids)})
 
-        # Store in vector database
-        store_chunks_in_pinecone(
-            chunks,
-            metadata,
-            [f"source_{source_id}_chunk_{i}" for i in range(len(chunks))]
-        )
+        # Remove what the new version no longer contains before the swap: once
+        # the new manifest is committed a retry could no longer tell what vanished
+        vanished = sorted(stored_ids - set(ids))
+        if vanished:
+            delete_chunk_vectors(ids=vanished)
+        replaced = previous_file_path != file_path
+        if replaced and not stored_ids:
+            # Chunks stored before the manifest existed have positional ids
+            delete_chunk_vectors(filter={"source_id": source_id, "chunk_hash": {"$exists": False}})
 
-        # Update source status
+        # Swap: the manifest, file and status change in one transaction
         with SessionLocal() as db:
             knowledge_source = db.query(KnowledgeSource).filter(
                 KnowledgeSource.id == source_id).first()
-            if knowledge_source:
-                knowledge_source.status = "completed"
-                db.commit()
-                logger.info(
-                    f"Knowledge source {source_id} processing completed")
-            else:
-                logger.error(f"Knowledge source {source_id} not found in DB")
+            if not knowledge_source:
+                logger.error(f"Knowledge source {source_id} was deleted during processing")
+                _discard_vectors(source_id, sent)
+                return
+            db.query(KnowledgeChunk).filter(KnowledgeChunk.source_id == source_id).delete()
+            db.add_all([
+                KnowledgeChunk(id=id_, source_id=source_id, content_hash=chunk_hash)
+                for id_, chunk_hash in zip(ids, hashes)
+            ])
+            knowledge_source.file_path = file_path
+            if content_hash:
+                knowledge_source.content_hash = content_hash
+            knowledge_source.status = "completed"
+            # New chunks are searchable now, so cached answers are stale
+            bump_corpus_version(db)
+            db.commit()
+            sent.clear()  # the manifest now refers to every chunk written
+            logger.info(
+                f"Knowledge source {source_id} processing completed")
+
+        if replaced:
+            try:
+                delete_stored_file(previous_file_path)
+            except Exception as e:
+                logger.error(f"Failed to delete replaced file {previous_file_path}: {e}")
+        report("done", {"total_chunks": len(ids), "new_chunks": stats["chunks"], "deleted_chunks": len(vanished)})
 
     except Exception as e:
         logger.error(
             f"Error processing knowledge source {source_id}: {str(e)}")
-
-        # Update source status to failed
-        with SessionLocal() as db:
-            knowledge_source = db.query(KnowledgeSource).filter(
-                KnowledgeSource.id == source_id).first()
-            if knowledge_source:
-                knowledge_source.status = "failed"
-                db.commit()
-                logger.info(f"Knowledge source {source_id} marked as failed")
+        # Chunks of the new version that aren't in the stored manifest would be orphaned
+        _discard_vectors(source_id, sent - stored_ids)
+        raise
     
     finally:
         # Clean up temporary file if created
@@ -0,0 +1,165 @@
+"""Ingestion worker: claims jobs from the ingestion_jobs table and processes them.
+
+Runs separately from the API so OCR, transcription and embedding never
+compete with chat traffic, and can be scaled on its own:
+
+    python -m app.knowledge.worker --concurrency 4
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+
+from app.config import settings
+from app.database import SessionLocal
+from app.knowledge.jobs import (
+    ClaimedJob, claim_job, complete_job, discard_replacement_file, extend_lease, fail_job, report_progress
+)
+from app.knowledge.models import KnowledgeSource
+from app.knowledge.service import process_knowledge_source
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(Exception):
+    """The job was reclaimed by another worker while this one was running it"""
+
+
+def _backoff(failures: int, base: float, cap: float = 60.0) -> float:
+    return min(base * (2 ** (failures - 1)), cap)
+
+
+def _keep_lease(job: ClaimedJob, worker_id: str, done: threading.Event):
+    """Renew the lease during long steps (a single OCR call can take minutes)
+
+    A failed renewal (say the database is briefly unreachable) is retried
+    sooner, with backoff, so one error doesn't let the lease run out.
+    """
+    interval = max(settings.INGEST_JOB_LEASE_SECONDS / 3, 1)
+    failures = 0
+    delay = interval
+    while not done.wait(delay):
+        try:
+            owned = extend_lease(job.id, worker_id)
+        except Exception as e:
+            failures += 1
+            delay = min(_backoff(failures, 1.0), interval)
+            logger.error(f"Worker {worker_id} failed to renew the lease on job {job.id}: {e}")
+            continue
+        if not owned:
+            logger.warning(f"Worker {worker_id} lost the lease on job {job.id}")
+            return
+        failures = 0
+        delay = interval
+
+
+def run_job(job: ClaimedJob, worker_id: str):
+    with SessionLocal() as db:
+        source = db.query(KnowledgeSource).filter(KnowledgeSource.id == job.source_id).first()
+        file_path, file_type = (source.file_path, source.file_type) if source else (None, None)
+    if source is None:
+        logger.info(f"Knowledge source {job.source_id} was deleted; dropping job {job.id}")
+        complete_job(job.id, worker_id)
+        discard_replacement_file(job.id, job.kind, job.payload)
+        return
+
+    content_hash = None
+    if job.kind == "reingest":
+        # The replacement file only becomes the source's file once processing succeeds
+        file_path = job.payload["file_path"]
+        content_hash = job.payload.get("content_hash")
+
+    def report(stage: str, progress: dict):
+        if not report_progress(job.id, worker_id, stage, progress):
+            raise LeaseLostError(f"Lease on job {job.id} lost at stage {stage}")
+
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_keep_lease, args=(job, worker_id, done), daemon=True)
+    heartbeat.start()
+    try:
+        process_knowledge_source(job.source_id, file_path, file_type, report=report, content_hash=content_hash)
+    except LeaseLostError as e:
+        logger.warning(str(e))
+        return
+    except Exception as e:
+        try:
+            fail_job(job, worker_id, str(e))
+        except Exception as db_error:
+            # The lease runs out and the job is picked up again
+            logger.error(f"Worker {worker_id} failed to record the failure of job {job.id}: {db_error}")
+        return
+    finally:
+        done.set()
+        heartbeat.join()
+    try:
+        complete_job(job.id, worker_id)
+    except Exception as e:
+        logger.error(f"Worker {worker_id} failed to mark job {job.id} as done: {e}")
+
+
+def worker_loop(worker_id: str, stop: threading.Event, poll_interval: float, once: bool = False):
+    logger.info(f"Ingestion worker {worker_id} started")
+    failures = 0
+    while not stop.is_set():
+        try:
+            job = claim_job(worker_id)
+        except Exception as e:
+            failures += 1
+            logger.error(f"Worker {worker_id} failed to claim a job: {e}")
+            if once:
+                break
+            stop.wait(_backoff(failures, poll_interval))
+            continue
+        if job is None:
+            failures = 0
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        logger.info(f"Worker {worker_id} running job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+        try:
+            run_job(job, worker_id)
+            failures = 0
+        except Exception as e:
+            # Never let one job's database error end the worker thread
+            failures += 1
+            logger.error(f"Worker {worker_id} failed while handling job {job.id}: {e}")
+            stop.wait(_backoff(failures, poll_interval))
+    logger.info(f"Ingestion worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued knowledge source ingestion jobs")
+    parser.add_argument("--concurrency", type=int, default=settings.INGEST_WORKER_CONCURRENCY,
+                        help="number of jobs processed in parallel by this process")
+    parser.add_argument("--poll-interval", type=float, default=settings.INGEST_WORKER_POLL_INTERVAL,
+                        help="seconds to wait before polling again when the queue is empty")
+    parser.add_argument("--once", action="store_true",
+                        help="exit once the queue is empty instead of polling")
+    args = parser.parse_args()
+
+    stop = threading.Event()
+
+    def shutdown(signum, frame):
+        logger.info("Stopping after the current jobs finish")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=worker_loop, args=(f"{prefix}:{n}", stop, args.poll_interval, args.once))
+        for n in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,46 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import json
+import logging
 from datetime import datetime, timezone
 
 from app.auth.router import router as auth_router
 from app.users.router import router as users_router
 from app.knowledge.router import router as knowledge_router
 from app.chat.router import router as chat_router
+from app.chat.service import get_rag_chain
+from app.knowledge.service import sync_lexical_index
+from app.utils import metrics
+from app.vector_store.chunk_cache import get_chunk_embedding_cache
+from app.vector_store.embedding_cache import get_query_embedding_cache
+from app.vector_store.lexical_index import lexical_index_enabled
+from app.vector_store.registry import get_client_registry
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared API clients once per worker and warm up their connections
+    registry = get_client_registry()
+    try:
+        await run_in_threadpool(registry.startup)
+        get_rag_chain()
+    except Exception as e:
+        logging.error(f"Failed to initialize API clients: {e}")
+    if lexical_index_enabled():
+        # Chunks stored while hybrid retrieval was off are not in the BM25 index yet
+        try:
+            await run_in_threadpool(sync_lexical_index)
+        except Exception as e:
+            logging.error(f"Failed to sync the lexical index: {e}")
+    yield
+    await registry.aclose()
 
 app = FastAPI(
     title="Skripsi Chatbot API",
     description="Backend API for RAG-based Skripsi Information Chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Custom JSON encoder for datetime with timezone
@@ -44,4 +73,16 @@ app.include_router(chat_router, prefix="/chat", tags=["Chat"])
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Skripsi Chatbot API"}
\ No newline at end of file
+    return {"message": "Welcome to Skripsi Chatbot API"}
+
+@app.get("/health")
+async def health():
+    status = await run_in_threadpool(get_client_registry().health)
+    cache = get_query_embedding_cache()
+    if cache is not None:
+        status["query_embedding_cache"] = cache.stats()
+    chunk_cache = get_chunk_embedding_cache()
+    if chunk_cache is not None:
+        status["chunk_embedding_cache"] = await run_in_threadpool(chunk_cache.stats)
+    status["metrics"] = metrics.snapshot()
+    return status
\ No newline at end of file
@@ -38,6 +38,43 @@ class SpacesStorage:
             print(f"Error uploading file: {e}")
             return None
 
+    def put_object(self, object_name, body, content_type="application/octet-stream"):
+        """Upload a small object in a single request"""
+        self.s3.put_object(
+            Bucket=self.bucket, Key=object_name, Body=body,
+            ContentType=content_type, ACL='public-read')
+        return object_name
+
+    def create_multipart_upload(self, object_name, content_type="application/octet-stream"):
+        """Start a multipart upload and return its upload id"""
+        response = self.s3.create_multipart_upload(
+            Bucket=self.bucket, Key=object_name,
+            ContentType=content_type, ACL='public-read')
+        return response['UploadId']
+
+    def upload_part(self, object_name, upload_id, part_number, body):
+        """Upload one part (at least 5 MB except for the last) and return its ETag"""
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=object_name, UploadId=upload_id,
+            PartNumber=part_number, Body=body)
+        return response['ETag']
+
+    def complete_multipart_upload(self, object_name, upload_id, etags):
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=object_name, UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'ETag': etag, 'PartNumber': number} for number, etag in enumerate(etags, start=1)
+            ]})
+        return object_name
+
+    def abort_multipart_upload(self, object_name, upload_id):
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=object_name, UploadId=upload_id)
+            return True
+        except Exception as e:
+            print(f"Error aborting multipart upload: {e}")
+            return False
+
     def download_file(self, object_name, file_path):
         """Download a file from a Space"""
         try:
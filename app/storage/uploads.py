@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+from app.storage.spaces_storage import SpacesStorage
+
+logger = logging.getLogger(__name__)
+
+
+class SpacesUploadWriter:
+    """Write a stream to a Space, switching to a multipart upload once it outgrows one part"""
+
+    def __init__(self, object_name: str, part_size: int):
+        self.object_name = object_name
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.content_type = mimetypes.guess_type(object_name)[0] or "application/octet-stream"
+        self.spaces = SpacesStorage()
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._etags = []
+
+    @property
+    def location(self) -> str:
+        return self.object_name
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._flush_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+
+    def _flush_part(self, body: bytes):
+        if self._upload_id is None:
+            self._upload_id = self.spaces.create_multipart_upload(self.object_name, self.content_type)
+        self._etags.append(self.spaces.upload_part(
+            self.object_name, self._upload_id, len(self._etags) + 1, body))
+
+    def close(self):
+        """Finish the upload; the object is durable once this returns"""
+        if self._upload_id is None:
+            self.spaces.put_object(self.object_name, bytes(self._buffer), self.content_type)
+        else:
+            if self._buffer:
+                self._flush_part(bytes(self._buffer))
+            self.spaces.complete_multipart_upload(self.object_name, self._upload_id, self._etags)
+        self._buffer = bytearray()
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.spaces.abort_multipart_upload(self.object_name, self._upload_id)
+
+    def discard(self):
+        """Delete the object after a completed upload turned out not to be needed"""
+        self.spaces.delete_file(self.object_name)
+
+
+class LocalUploadWriter:
+    """Write a stream to a temporary file next to the target and move it into place on close"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    @property
+    def location(self) -> str:
+        return self.path
+
+    def write(self, data: bytes):
+        self._file.write(data)
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        try:
+            os.rmdir(os.path.dirname(self.path))  # only succeeds for an emptied per-upload directory
+        except OSError:
+            pass
+
+
+def delete_stored_file(location: str):
+    """Delete a stored upload, from Spaces or from the local upload directory"""
+    if settings.USE_SPACES and not location.startswith(settings.UPLOAD_DIR):
+        SpacesStorage().delete_file(location)
+        return
+    if os.path.exists(location):
+        os.remove(location)
+    upload_dir = os.path.dirname(location)
+    if os.path.abspath(upload_dir) != os.path.abspath(settings.UPLOAD_DIR):
+        try:
+            os.rmdir(upload_dir)  # only succeeds for an emptied per-upload directory
+        except OSError:
+            pass
+
+
+@dataclass
+class StoredUpload:
+    location: str  # Spaces object name or local path
+    size: int
+    sha256: str
+
+
+# Form fields other than the file are small; anything bigger is not a legitimate upload form
+_MAX_FIELD_BYTES = 64 * 1024
+
+
+@dataclass
+class ReceivedUpload:
+    fields: Dict[str, str]  # the other form fields, e.g. the title
+    filename: str  # name of the uploaded file on the client
+    stored: StoredUpload
+
+
+class _MultipartEvents:
+    """Collects python-multipart parser callbacks as (event, value) pairs to handle after each write"""
+
+    def __init__(self):
+        self.events: List[Tuple[str, Any]] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._append("_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append("_value", data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": lambda: self.events.append(("part", self._headers)),
+            "on_part_data": lambda data, start, end: self.events.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: self.events.append(("end", None)),
+        }
+
+    def _append(self, name: str, data: bytes):
+        setattr(self, name, getattr(self, name) + data)
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+
+async def receive_upload(request: Request, file_field: str,
+                         open_writer: Callable[[str, Dict[str, str]], Any],
+                         max_bytes: int) -> ReceivedUpload:
+    """Stream a multipart/form-data upload from the request body straight into storage
+
+    The body is parsed as it arrives, so the file is never spooled to a
+    temporary file first. ``open_writer(filename, fields)`` is called when
+    the file part starts, with the form fields received before it, and
+    returns the writer to store it with. The upload is hashed on the way
+    and rejected with 413 as soon as it exceeds ``max_bytes``, or before
+    reading anything when Content-Length already says it will.
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"File size exceeds the limit of {max_bytes // (1024 * 1024)} MB"
+    )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + _MAX_FIELD_BYTES:
+        raise too_large
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    collector = _MultipartEvents()
+    parser = MultipartParser(options[b"boundary"], collector.callbacks())
+    hasher = hashlib.sha256()
+    fields: Dict[str, str] = {}
+    field_name = None
+    field_value = bytearray()
+    writer = None
+    filename = None
+    stored = None
+    size = 0
+    pending = bytearray()
+
+    def consume(chunk: bytes):
+        hasher.update(chunk)
+        writer.write(chunk)
+
+    async def flush():
+        if pending:
+            await asyncio.to_thread(consume, bytes(pending))
+            pending.clear()
+
+    try:
+        async for body in request.stream():
+            parser.write(body)
+            for event, value in collector.events:
+                if event == "part":
+                    _, disposition = parse_options_header(value.get(b"content-disposition"))
+                    field_name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    if field_name == file_field and b"filename" in disposition:
+                        if writer is not None:
+                            raise HTTPException(status_code=400, detail="Only one file can be uploaded")
+                        filename = disposition[b"filename"].decode("utf-8", "replace")
+                        writer = open_writer(filename, dict(fields))
+                        field_name = None
+                elif event == "data" and field_name is None and writer is not None and stored is None:
+                    size += len(value)
+                    if size > max_bytes:
+                        raise too_large
+                    pending += value
+                    if len(pending) >= settings.UPLOAD_CHUNK_SIZE:
+                        await flush()
+                elif event == "data" and field_name:
+                    field_value += value
+                    if len(field_value) > _MAX_FIELD_BYTES:
+                        raise HTTPException(status_code=413, detail=f"Form field '{field_name}' is too large")
+                elif event == "end":
+                    if field_name:
+                        fields[field_name] = field_value.decode("utf-8", "replace")
+                    elif writer is not None and stored is None:
+                        await flush()
+                        await asyncio.to_thread(writer.close)
+                        stored = StoredUpload(location=writer.location, size=size, sha256=hasher.hexdigest())
+                    field_name = None
+                    field_value = bytearray()
+            collector.events.clear()
+        parser.finalize()
+        if stored is None:
+            raise HTTPException(status_code=400, detail=f"No '{file_field}' file in the upload")
+    except BaseException:
+        if writer is not None:
+            try:
+                await asyncio.to_thread(writer.discard if stored is not None else writer.abort)
+            except Exception as e:
+                logger.error(f"Failed to abort upload to {writer.location}: {e}")
+        raise
+
+    logger.info(f"Stored upload at {writer.location} ({size} bytes)")
+    return ReceivedUpload(fields=fields, filename=filename, stored=stored)
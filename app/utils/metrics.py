@@ -0,0 +1,15 @@
+import threading
+from collections import defaultdict
+
+_counters = defaultdict(int)
+_lock = threading.Lock()
+
+def increment(name: str, amount: int = 1):
+    """Increment a process-local counter"""
+    with _lock:
+        _counters[name] += amount
+
+def snapshot() -> dict:
+    """Return a copy of all counters"""
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,18 @@
+import base64
+import json
+from fastapi import HTTPException
+
+def encode_cursor(values: dict) -> str:
+    """Encode keyset pagination values as an opaque URL-safe cursor"""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict):
+            raise ValueError("cursor is not an object")
+        return values
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
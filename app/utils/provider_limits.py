@@ -0,0 +1,31 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from app.config import settings
+
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+
+def _limit(provider: str) -> int:
+    return {
+        "mistral": settings.MISTRAL_MAX_CONCURRENCY,
+        "groq": settings.GROQ_MAX_CONCURRENCY,
+        "openai": settings.OPENAI_MAX_CONCURRENCY,
+    }[provider]
+
+
+@contextmanager
+def provider_slot(provider: str):
+    """Hold one of the process-wide concurrency slots of an external provider
+
+    Every ingestion worker thread shares these, so a pool of workers never
+    sends a provider more concurrent calls than its limit allows.
+    """
+    semaphore = _semaphores.get(provider)
+    if semaphore is None:
+        with _lock:
+            semaphore = _semaphores.setdefault(provider, threading.BoundedSemaphore(_limit(provider)))
+    with semaphore:
+        yield
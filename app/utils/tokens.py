@@ -0,0 +1,28 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the cl100k tokenizer, or estimate when it isn't available
+
+    cl100k_base is the tokenizer of both the chat history budget and the
+    text-embedding-3 models.
+    """
+    global _encoding
+    if _encoding is None:
+        with _lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+                    _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """sha256 hex digest of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Persistent cache from (sha256 of chunk text, embedding model) to vector.
+
+    Backed by SQLite in WAL mode so the API workers and ingestion jobs can
+    share it. When the number of entries exceeds ``max_entries`` the least
+    recently used tenth is evicted.
+    """
+
+    def __init__(self, path: str, model: str, max_entries: int):
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+            " content_hash TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (content_hash, model))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_last_used ON chunk_embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, texts: List[str]) -> Dict[int, List[float]]:
+        """Return cached vectors keyed by position in ``texts``"""
+        hashes = [content_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique = list(set(hashes))
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM chunk_embeddings "
+                    f"WHERE model = ? AND content_hash IN ({','.join('?' * len(part))})",
+                    [self.model, *part],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE chunk_embeddings SET last_used = ? WHERE content_hash = ? AND model = ?",
+                    [(now, h, self.model) for h in found],
+                )
+                self._conn.commit()
+
+        result = {
+            i: np.frombuffer(found[h], dtype=np.float32).tolist()
+            for i, h in enumerate(hashes) if h in found
+        }
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = [
+            (content_hash(text), self.model, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (content_hash, model, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM chunk_embeddings WHERE rowid IN ("
+                    " SELECT rowid FROM chunk_embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str], embed) -> List[List[float]]:
+        """Embed ``texts``, calling ``embed`` only for chunks that are not cached"""
+        vectors = self.get_many(texts)
+        missing = list(dict.fromkeys(texts[i] for i in range(len(texts)) if i not in vectors))
+        if missing:
+            new_vectors = dict(zip(missing, embed(missing)))
+            self.put_many(list(new_vectors), list(new_vectors.values()))
+            for i, text in enumerate(texts):
+                if i not in vectors:
+                    vectors[i] = new_vectors[text]
+        return [vectors[i] for i in range(len(texts))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[ChunkEmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_chunk_embedding_cache() -> Optional[ChunkEmbeddingCache]:
+    """Return the process-wide chunk embedding cache, or None when disabled"""
+    global _cache
+    if not settings.CHUNK_EMBEDDING_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChunkEmbeddingCache(
+                    settings.CHUNK_EMBEDDING_CACHE_PATH,
+                    settings.EMBEDDING_MODEL,
+                    settings.CHUNK_EMBEDDING_CACHE_MAX_ENTRIES,
+                )
+    return _cache
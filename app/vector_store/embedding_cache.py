@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry"""
+    query = unicodedata.normalize("NFKC", query).lower().strip()
+    return re.sub(r"\s+", " ", query)
+
+
+class InMemoryCacheBackend:
+    """Size-bounded LRU cache with per-entry TTL, local to the worker process"""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: List[float]):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCacheBackend:
+    """Cache shared by all workers through Redis.
+
+    Entries expire after the TTL; size-bounded LRU eviction is left to the
+    Redis ``maxmemory-policy allkeys-lru`` setting.
+    """
+
+    def __init__(self, url: str, ttl: int, prefix: str = "qemb:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis package is required for the redis embedding cache backend") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[List[float]]:
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: List[float]):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+
+class QueryEmbeddingCache:
+    """Cache of query embeddings keyed on the normalized query text and model name"""
+
+    def __init__(self, backend, model: str):
+        self.backend = backend
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, query: str) -> str:
+        raw = f"{self.model}\n{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str) -> Optional[List[float]]:
+        try:
+            value = self.backend.get(self.make_key(query))
+        except Exception as e:
+            logger.warning(f"Query embedding cache lookup failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, query: str, embedding: List[float]):
+        try:
+            self.backend.set(self.make_key(query), embedding)
+        except Exception as e:
+            logger.warning(f"Query embedding cache store failed: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[QueryEmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> Optional[QueryEmbeddingCache]:
+    """Return the process-wide query embedding cache, or None when disabled"""
+    global _cache
+    if settings.QUERY_EMBEDDING_CACHE_BACKEND == "none":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if settings.QUERY_EMBEDDING_CACHE_BACKEND == "redis":
+                    backend = RedisCacheBackend(settings.REDIS_URL, settings.QUERY_EMBEDDING_CACHE_TTL)
+                else:
+                    backend = InMemoryCacheBackend(
+                        settings.QUERY_EMBEDDING_CACHE_SIZE, settings.QUERY_EMBEDDING_CACHE_TTL)
+                _cache = QueryEmbeddingCache(backend, settings.EMBEDDING_MODEL)
+    return _cache
@@ -0,0 +1,225 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.provider_limits import provider_slot
+from app.vector_store.chunk_cache import get_chunk_embedding_cache
+from app.vector_store.lexical_index import get_lexical_index, lexical_index_enabled
+from app.vector_store.registry import get_client_registry
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionError(Exception):
+    """Raised when some batches still fail after all retries"""
+
+
+def upsert_embeddings(texts: List[str], vectors: List[List[float]],
+                      metadatas: List[Dict[str, Any]], ids: List[str]):
+    """Write precomputed vectors to the configured vector store"""
+    registry = get_client_registry()
+    vector_store = registry.vector_store
+    if registry.uses_local_index:
+        vector_store.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+        return
+    # Same layout PineconeVectorStore.add_texts uses: chunk text under the 'text' metadata key
+    records = [
+        {"id": id_, "values": vector, "metadata": {**metadata, "text": text}}
+        for id_, vector, metadata, text in zip(ids, vectors, metadatas, texts)
+    ]
+    for request in _split_by_payload_size(records, settings.PINECONE_UPSERT_MAX_BYTES):
+        registry.index.upsert(vectors=request)
+
+
+def _split_by_payload_size(records: List[dict], max_bytes: int) -> Iterator[List[dict]]:
+    """Group upsert records into requests whose JSON body stays under ``max_bytes``"""
+    request, size = [], 0
+    for record in records:
+        record_size = len(json.dumps(record)) + 1
+        if request and size + record_size > max_bytes:
+            yield request
+            request, size = [], 0
+        request.append(record)
+        size += record_size
+    if request:
+        yield request
+
+
+def _batched(records: Iterable[Tuple[str, Dict[str, Any], str]], size: int) -> Iterator[list]:
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class BatchedIngestionWriter:
+    """Embed and upsert chunks in concurrent batches, retrying failed batches individually"""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_backoff: Optional[float] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.max_concurrency = max_concurrency or settings.INGEST_MAX_CONCURRENCY
+        self.max_retries = settings.INGEST_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = settings.INGEST_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        embeddings = get_client_registry().embeddings
+
+        def embed(batch: List[str]) -> List[List[float]]:
+            with provider_slot("openai"):
+                return embeddings.embed_documents(batch)
+
+        cache = get_chunk_embedding_cache()
+        if cache is None:
+            return embed(texts)
+        # Only chunks whose text has not been embedded before reach the API
+        return cache.embed_documents(texts, embed)
+
+    def _upsert(self, texts, vectors, metadatas, ids):
+        upsert_embeddings(texts, vectors, metadatas, ids)
+        if lexical_index_enabled():
+            get_lexical_index().add(ids, texts, metadatas)
+
+    def _with_retry(self, stage: str, batch_no: int, fn: Callable, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt) * (1 + random.random() / 2)
+                logger.warning(
+                    f"{stage} of batch {batch_no} failed (attempt {attempt + 1}/{self.max_retries + 1}): {e}; "
+                    f"retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def write_stream(self, records: Iterable[Tuple[str, Dict[str, Any], str]],
+                     source_id: Optional[int] = None,
+                     on_batch: Optional[Callable[[int, int], None]] = None) -> dict:
+        """Store (text, metadata, id) records as they are produced and return throughput statistics
+
+        The calling thread pulls records and groups them into batches. Batches
+        then pass through two bounded queues, one to the embedding workers and
+        one to the upsert workers. Producing, embedding and writing overlap in
+        time, and only a few batches are ever held in memory. Each chunk is
+        searchable as soon as its batch is upserted. The first batch that still
+        fails after its retries stops the pipeline. ``on_batch(queued,
+        written)`` is called in the calling thread after each batch is queued.
+        """
+        start = time.perf_counter()
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        upsert_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        lock = threading.Lock()
+        failures = []
+        totals = {"written": 0, "embed_seconds": 0.0, "upsert_seconds": 0.0}
+
+        def embed_worker():
+            while True:
+                item = embed_queue.get()
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue  # drain so the producer never blocks
+                batch_no, texts, metadatas, ids = item
+                started = time.perf_counter()
+                try:
+                    vectors = self._with_retry("Embedding", batch_no, self._embed, texts)
+                except Exception as e:
+                    with lock:
+                        failures.append((batch_no, e))
+                    stop.set()
+                    continue
+                with lock:
+                    totals["embed_seconds"] += time.perf_counter() - started
+                upsert_queue.put((batch_no, texts, vectors, metadatas, ids))
+
+        def upsert_worker():
+            while True:
+                item = upsert_queue.get()
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue
+                batch_no, texts, vectors, metadatas, ids = item
+                started = time.perf_counter()
+                try:
+                    self._with_retry("Upsert", batch_no, self._upsert, texts, vectors, metadatas, ids)
+                except Exception as e:
+                    with lock:
+                        failures.append((batch_no, e))
+                    stop.set()
+                    continue
+                with lock:
+                    totals["upsert_seconds"] += time.perf_counter() - started
+                    totals["written"] += len(texts)
+
+        embedders = [threading.Thread(target=embed_worker, daemon=True) for _ in range(self.max_concurrency)]
+        upserters = [threading.Thread(target=upsert_worker, daemon=True) for _ in range(self.max_concurrency)]
+        for thread in embedders + upserters:
+            thread.start()
+
+        batches = queued = 0
+        try:
+            for batch in _batched(records, self.batch_size):
+                if stop.is_set():
+                    break
+                texts, metadatas, ids = (list(column) for column in zip(*batch))
+                embed_queue.put((batches, texts, metadatas, ids))
+                batches += 1
+                queued += len(texts)
+                if on_batch:
+                    on_batch(queued, totals["written"])
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            for _ in embedders:
+                embed_queue.put(None)
+            for thread in embedders:
+                thread.join()
+            for _ in upserters:
+                upsert_queue.put(None)
+            for thread in upserters:
+                thread.join()
+
+        elapsed = time.perf_counter() - start
+        written = totals["written"]
+        stats = {
+            "source_id": source_id,
+            "chunks": written,
+            "batches": batches,
+            "failed_batches": len(failures),
+            "seconds": round(elapsed, 3),
+            "embed_seconds": round(totals["embed_seconds"], 3),
+            "upsert_seconds": round(totals["upsert_seconds"], 3),
+            "chunks_per_sec": round(written / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        logger.info(f"Ingestion stats for source {source_id}: {stats}")
+
+        if failures:
+            failed = ", ".join(str(batch_no) for batch_no, _ in sorted(failures, key=lambda f: f[0]))
+            raise IngestionError(
+                f"{len(failures)} of {batches} batches failed for source {source_id} "
+                f"(batches {failed}): {failures[0][1]}")
+        return stats
+
+    def write(self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+              source_id: Optional[int] = None) -> dict:
+        """Store all chunks and return throughput statistics"""
+        return self.write_stream(zip(texts, metadatas, ids), source_id=source_id)
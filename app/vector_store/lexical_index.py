@@ -0,0 +1,230 @@
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.vector_store.local_index import matches_filter
+
+logger = logging.getLogger(__name__)
+
+# Very common Indonesian and English function words that carry no retrieval signal
+STOPWORDS = {
+    "yang", "dan", "di", "ke", "dari", "untuk", "dengan", "pada", "ini", "itu",
+    "atau", "adalah", "akan", "dalam", "juga", "tidak", "bisa", "ada", "oleh",
+    "sebagai", "saya", "apa", "apakah", "bagaimana", "the", "of", "and", "to",
+    "a", "in", "is", "for",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, keeping numbers and roman numerals like 'iii'"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [token for token in re.findall(r"\w+", text) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunk texts, updated incrementally.
+
+    The index is persisted as an append-only log, one JSON line per added
+    chunk (with its term counts, so loading never re-tokenizes) or removal,
+    so that every worker process (and the ingestion job) sees the same
+    postings. Writers hold an exclusive file lock and append; readers apply
+    just the lines written since their last read. When superseded lines
+    outnumber live chunks the log is compacted into a fresh file.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, compact_min_records: int = 1024):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.compact_min_records = compact_min_records
+        self._lock = threading.RLock()
+        self._reset()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._reload_if_changed()
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reset(self):
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._total_len = 0
+        self._loaded_inode = None
+        self._offset = 0
+        self._records = 0
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._loaded_inode or stat.st_size < self._offset:
+            self._reset()
+            self._loaded_inode = stat.st_ino
+        if stat.st_size <= self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            self._apply(json.loads(line))
+
+    def _apply(self, record: Dict[str, Any]):
+        self._records += 1
+        if "removed" in record:
+            for doc_id in record["removed"]:
+                self._unindex_doc(doc_id)
+        else:
+            self._index_doc(record["id"], record["content"], record["metadata"], record["terms"])
+
+    def _append(self, records: List[Dict[str, Any]]):
+        """Append records to the log and apply them; call with both locks held and the index reloaded"""
+        with open(self.path, "ab") as f:
+            f.truncate(self._offset)  # drop a line torn by a crashed writer
+            f.write("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._loaded_inode = os.stat(self.path).st_ino
+        self._reload_if_changed()
+        if self._records >= self.compact_min_records and self._records > 2 * len(self._docs):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log with one line per live chunk"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc_id, doc in self._docs.items():
+                f.write(json.dumps({"id": doc_id, "content": doc["content"], "metadata": doc["metadata"],
+                                    "terms": doc["terms"]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._reset()
+        self._reload_if_changed()
+
+    def _index_doc(self, doc_id: str, content: str, metadata: Dict[str, Any], terms: Dict[str, int]):
+        self._unindex_doc(doc_id)
+        self._docs[doc_id] = {"content": content, "metadata": metadata, "terms": terms}
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        length = sum(terms.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def _unindex_doc(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            self._append([
+                {"id": doc_id, "content": text, "metadata": metadata, "terms": dict(Counter(tokenize(text)))}
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ])
+
+    def remove(self, ids: Optional[List[str]] = None, source_id: Optional[int] = None,
+               filter: Optional[Dict[str, Any]] = None):
+        """Remove chunks by id, every chunk of one knowledge source, or chunks matching a metadata filter"""
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            targets = set(ids or [])
+            if source_id is not None:
+                targets.update(
+                    doc_id for doc_id, doc in self._docs.items()
+                    if doc["metadata"].get("source_id") == source_id
+                )
+            if filter is not None:
+                targets.update(
+                    doc_id for doc_id, doc in self._docs.items()
+                    if matches_filter(doc["metadata"], filter)
+                )
+            targets &= self._docs.keys()
+            if not targets:
+                return
+            self._append([{"removed": sorted(targets)}])
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return the ids and BM25 scores of the best matching chunks"""
+        with self._lock:
+            self._reload_if_changed()
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._docs.get(doc_id)
+
+    def ids(self) -> Set[str]:
+        with self._lock:
+            self._reload_if_changed()
+            return set(self._docs)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge several ranked id lists; ids ranked high in any list float to the top"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def lexical_index_enabled() -> bool:
+    """The BM25 index is only read by hybrid retrieval, so it is only maintained then"""
+    return settings.RETRIEVAL_MODE == "hybrid"
+
+
+def get_lexical_index() -> BM25Index:
+    """Return the process-wide BM25 index"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = BM25Index(settings.LEXICAL_INDEX_PATH)
+    return _index
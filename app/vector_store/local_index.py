@@ -0,0 +1,434 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Pinecone-style metadata filter against one metadata dict"""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op == "$exists" and (key in metadata) != operand:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+    return True
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector index kept as memory-mapped, append-only files on disk.
+
+    Vectors are stored L2-normalized as raw float32 rows in
+    ``vectors.<gen>.f32`` so that cosine similarity is a single matrix-vector
+    product; ids, texts and metadata are appended to ``log.<gen>.jsonl`` one
+    line per row, and deletions append tombstones instead of rewriting
+    anything. ``manifest.json`` names the current generation; once more than
+    half the rows are dead, the live ones are compacted into a new generation.
+    Search is brute force by default, or IVF (k-means coarse quantizer) when
+    ``search_mode="ivf"`` and the index is big enough for it to pay off.
+    Writes take an exclusive file lock and other worker processes read just
+    the new log lines on their next search.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: str,
+        search_mode: str = "flat",
+        nlist: int = 64,
+        nprobe: int = 8,
+        ivf_min_vectors: int = 2048,
+        compact_min_rows: int = 1024,
+    ):
+        self._embedding = embedding
+        self.path = path
+        self.search_mode = search_mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_vectors = ivf_min_vectors
+        self.compact_min_rows = compact_min_rows
+
+        self._lock = threading.RLock()
+        self._manifest_identity = None
+        self._reset(generation=0, dimension=0)
+
+        os.makedirs(self.path, exist_ok=True)
+        self._reload_if_changed()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # Persistence
+
+    @property
+    def _manifest_file(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def _vectors_file(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.f32")
+
+    def _log_file(self, generation: int) -> str:
+        return os.path.join(self.path, f"log.{generation}.jsonl")
+
+    @contextmanager
+    def _write_lock(self):
+        with open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reset(self, generation: int, dimension: int):
+        self._generation = generation
+        self._dimension = dimension
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._log_offset = 0
+        self._centroids = None
+        self._lists = None
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self._manifest_file)
+        except FileNotFoundError:
+            return
+        identity = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if identity != self._manifest_identity:
+            with open(self._manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self._reset(manifest["generation"], manifest["dimension"])
+            self._manifest_identity = identity
+        self._read_log()
+
+    def _read_log(self):
+        """Apply the log lines written since the last read"""
+        log_file = self._log_file(self._generation)
+        try:
+            if os.path.getsize(log_file) <= self._log_offset:
+                return
+        except FileNotFoundError:
+            return
+        with open(log_file, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # a torn last line is left for the writer to truncate
+        if end == 0:
+            return
+        self._log_offset += end
+
+        added = 0
+        dead = []
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if "deleted" in record:
+                dead.extend(record["deleted"])
+                continue
+            row = len(self._ids)
+            previous = self._id_to_row.get(record["id"])
+            if previous is not None:
+                dead.append(previous)
+            self._ids.append(record["id"])
+            self._texts.append(record["text"])
+            self._metadatas.append(record["metadata"])
+            self._id_to_row[record["id"]] = row
+            added += 1
+
+        if added:
+            self._alive = np.concatenate([self._alive, np.ones(added, dtype=bool)])
+            self._vectors = np.memmap(
+                self._vectors_file(self._generation), dtype=np.float32, mode="r",
+                shape=(len(self._ids), self._dimension))
+        for row in dead:
+            if self._alive[row]:
+                self._alive[row] = False
+                if self._id_to_row.get(self._ids[row]) == row:
+                    del self._id_to_row[self._ids[row]]
+        self._centroids = None
+        self._lists = None
+
+    def _write_manifest(self, generation: int, dimension: int):
+        tmp = self._manifest_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "dimension": dimension}, f)
+        os.replace(tmp, self._manifest_file)
+
+    def _write_generation(self, generation: int, dimension: int, rows: Iterable[Tuple[np.ndarray, str, str, dict]]):
+        """Write a fresh generation from (vector, id, text, metadata) rows and switch the manifest to it"""
+        with open(self._vectors_file(generation), "wb") as vectors_out, \
+                open(self._log_file(generation), "w", encoding="utf-8") as log_out:
+            for vector, id_, text, metadata in rows:
+                vectors_out.write(np.asarray(vector, dtype=np.float32).tobytes())
+                log_out.write(json.dumps({"id": id_, "text": text, "metadata": metadata}) + "\n")
+        self._write_manifest(generation, dimension)
+
+    def _append(self, vectors: np.ndarray, ids: List[str], texts: List[str],
+                metadatas: List[Dict[str, Any]], deleted_rows: List[int]):
+        """Append rows and tombstones; call with both locks held and the index reloaded"""
+        if not os.path.exists(self._manifest_file) or (self._dimension == 0 and len(ids)):
+            self._reset(self._generation, vectors.shape[1] if len(ids) else 0)
+            self._write_generation(self._generation, self._dimension, [])
+            self._manifest_identity = None
+            self._reload_if_changed()
+        if len(ids) and vectors.shape[1] != self._dimension:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match the index ({self._dimension})")
+
+        # Drop whatever a crashed writer left past the last logged row or line
+        vectors_file = self._vectors_file(self._generation)
+        log_file = self._log_file(self._generation)
+        with open(vectors_file, "r+b") as f:
+            f.truncate(len(self._ids) * self._dimension * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(log_file, "r+b") as f:
+            f.truncate(self._log_offset)
+            f.seek(0, os.SEEK_END)
+            lines = []
+            if deleted_rows:
+                lines.append(json.dumps({"deleted": deleted_rows}))
+            lines.extend(
+                json.dumps({"id": id_, "text": text, "metadata": metadata})
+                for id_, text, metadata in zip(ids, texts, metadatas))
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._read_log()
+
+        dead = len(self._ids) - int(self._alive.sum())
+        if len(self._ids) >= self.compact_min_rows and dead * 2 > len(self._ids):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the live rows into a new generation, then drop the old files"""
+        old_generation = self._generation
+        live = np.flatnonzero(self._alive)
+        self._write_generation(
+            old_generation + 1, self._dimension,
+            ((self._vectors[row], self._ids[row], self._texts[row], self._metadatas[row]) for row in live))
+        self._reload_if_changed()
+        for path in (self._vectors_file(old_generation), self._log_file(old_generation)):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Compacted local vector index to {len(live)} vectors (generation {self._generation})")
+
+    # Writes
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Insert or replace vectors computed elsewhere"""
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"local_{os.urandom(8).hex()}" for _ in texts]
+        new = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(new, axis=1, keepdims=True)
+        new = new / np.where(norms == 0, 1, norms)
+
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            # Replaced ids are superseded by their new row when the log is read
+            self._append(new, list(ids), list(texts), [dict(m) for m in metadatas], [])
+        return list(ids)
+
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        delete_all: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> None:
+        if not ids and filter is None and not delete_all:
+            raise ValueError("Either ids, delete_all, or filter must be provided.")
+        with self._lock, self._write_lock():
+            self._reload_if_changed()
+            if delete_all:
+                if self._ids:
+                    old_generation = self._generation
+                    self._write_generation(old_generation + 1, self._dimension, [])
+                    for path in (self._vectors_file(old_generation), self._log_file(old_generation)):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    self._reload_if_changed()
+                return None
+            rows = {self._id_to_row[id_] for id_ in (ids or []) if id_ in self._id_to_row}
+            if filter is not None:
+                rows.update(
+                    row for row in self._id_to_row.values() if matches_filter(self._metadatas[row], filter))
+            if rows:
+                self._append(np.zeros((0, self._dimension), dtype=np.float32), [], [], [], sorted(rows))
+        return None
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        with self._lock:
+            self._reload_if_changed()
+            return [
+                Document(id=id_, page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+                for id_ in ids
+                for row in [self._id_to_row.get(id_)] if row is not None
+            ]
+
+    # Search
+
+    def _build_ivf(self):
+        live = np.flatnonzero(self._alive)
+        n = len(live)
+        nlist = min(self.nlist, max(1, n // 39))
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(live, size=min(n, nlist * 256), replace=False))]
+        centroids = np.asarray(sample[rng.choice(len(sample), size=nlist, replace=False)])
+        for _ in range(10):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1)
+        assignment = np.argmax(self._vectors[live] @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [live[assignment == c] for c in range(nlist)]
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self.search_mode != "ivf" or len(self._id_to_row) < self.ivf_min_vectors:
+            return None
+        if self._centroids is None:
+            self._build_ivf()
+        probes = np.argsort(-(self._centroids @ query))[: self.nprobe]
+        return np.concatenate([self._lists[c] for c in probes])
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        with self._lock:
+            self._reload_if_changed()
+            if not self._id_to_row:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+
+            rows = self._candidate_rows(query)
+            if rows is None:
+                rows = np.flatnonzero(self._alive)
+            if filter:
+                rows = np.asarray(
+                    [row for row in rows if matches_filter(self._metadatas[row], filter)], dtype=np.int64)
+            if len(rows) == 0:
+                return []
+
+            scores = self._vectors[rows] @ query
+            top = np.argsort(-scores)[:k]
+            results = []
+            for i in top:
+                row = int(rows[i])
+                doc = Document(
+                    id=self._ids[row],
+                    page_content=self._texts[row],
+                    metadata=dict(self._metadatas[row]),
+                )
+                results.append((doc, float(scores[i])))
+            return results
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def describe_index_stats(self) -> dict:
+        with self._lock:
+            self._reload_if_changed()
+            return {"total_vector_count": len(self._id_to_row), "dimension": self._dimension}
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        path: str = "vector_index",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, path, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -1,41 +1,159 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone
-from typing import List, Dict, Any
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
 
 from app.config import settings
+from app.vector_store.embedding_cache import get_query_embedding_cache
+from app.vector_store.ingestion import BatchedIngestionWriter
+from app.vector_store.lexical_index import get_lexical_index, lexical_index_enabled, reciprocal_rank_fusion
+from app.vector_store.registry import get_client_registry
+
+logger = logging.getLogger(__name__)
 
 def get_vector_store():
-    """Initialize and return the vector store instance"""
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-    index = pc.Index(settings.PINECONE_INDEX_NAME)
-    vector_store = PineconeVectorStore(embedding=embeddings, index=index)
-    return vector_store
-
-def store_chunks_in_pinecone(texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str]):
-    """Store text chunks in Pinecone vector store"""
+    """Return the shared vector store instance"""
+    return get_client_registry().vector_store
+
+def store_chunks_in_pinecone(texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+                             source_id: Optional[int] = None) -> dict:
+    """Store text chunks in the vector store in concurrent, retried batches
+
+    Returns throughput statistics for the source.
+    """
+    return BatchedIngestionWriter().write(texts, metadatas, ids, source_id=source_id)
+
+def stream_chunks_to_pinecone(records: Iterable[Tuple[str, Dict[str, Any], str]],
+                              source_id: Optional[int] = None,
+                              on_batch: Optional[Callable[[int, int], None]] = None) -> dict:
+    """Store (text, metadata, id) records as they are produced, through the pipelined writer
+
+    Returns throughput statistics for the source.
+    """
+    return BatchedIngestionWriter().write_stream(records, source_id=source_id, on_batch=on_batch)
+
+def delete_source_vectors(source_id: int):
+    """Delete every chunk belonging to a knowledge source"""
     vector_store = get_vector_store()
-    vector_store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
-    return True
+    vector_store.delete(filter={"source_id": source_id})
+    if lexical_index_enabled():
+        get_lexical_index().remove(source_id=source_id)
+
+def delete_chunk_vectors(ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None):
+    """Delete specific chunks by id or metadata filter, leaving the rest of their source in place"""
+    vector_store = get_vector_store()
+    if ids:
+        vector_store.delete(ids=ids)
+    if filter is not None:
+        vector_store.delete(filter=filter)
+    if lexical_index_enabled():
+        get_lexical_index().remove(ids=ids, filter=filter)
+
+def fetch_chunks(ids: List[str], batch_size: int = 100) -> List[Document]:
+    """Fetch stored chunks (text and metadata) by id; ids that are not stored are skipped"""
+    registry = get_client_registry()
+    if registry.uses_local_index:
+        return registry.vector_store.get_by_ids(ids)
+    docs = []
+    for start in range(0, len(ids), batch_size):
+        response = registry.index.fetch(ids=ids[start:start + batch_size])
+        for id_, vector in response.vectors.items():
+            metadata = dict(vector.metadata or {})
+            docs.append(Document(id=id_, page_content=metadata.pop("text", ""), metadata=metadata))
+    return docs
 
-def retrieve_relevant_chunks(query: str, k: int = 5) -> list:
-    """Retrieve relevant chunks from vector store based on query, including source metadata"""
+async def embed_query(query: str) -> List[float]:
+    """Embed a search query, going through the query embedding cache when enabled"""
+    embeddings = get_client_registry().embeddings
+    cache = get_query_embedding_cache()
+    if cache is None:
+        return await embeddings.aembed_query(query)
+    # The shared (redis) backend does network I/O, so keep lookups off the event loop
+    embedding = await asyncio.to_thread(cache.get, query)
+    if embedding is None:
+        embedding = await embeddings.aembed_query(query)
+        await asyncio.to_thread(cache.set, query, embedding)
+    return embedding
+
+def _to_chunk(content: str, metadata: Dict[str, Any]) -> dict:
+    chunk = {
+        "content": content,
+        "source": metadata.get("source", "unknown")
+    }
+    if metadata.get("section_path"):
+        chunk["section_path"] = metadata["section_path"]
+    if "start_seconds" in metadata:
+        # Transcribed audio: where in the recording this chunk was said
+        chunk["start_seconds"] = metadata["start_seconds"]
+        chunk["end_seconds"] = metadata.get("end_seconds")
+    return chunk
+
+def _format_offset(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def _dense_search(vector_store, embedding: List[float], k: int) -> list:
+    # PineconeVectorStore only implements the with-score variant of search by vector
+    return [doc for doc, _ in vector_store.similarity_search_by_vector_with_score(embedding, k=k)]
+
+async def retrieve_relevant_chunks(query: str, k: Optional[int] = None, mode: Optional[str] = None) -> list:
+    """Retrieve relevant chunks from vector store based on query, including source metadata
+
+    In 'hybrid' mode the dense results are fused with BM25 results using
+    reciprocal-rank fusion.
+    """
+    k = k or settings.RETRIEVAL_K
+    mode = mode or settings.RETRIEVAL_MODE
+    embedding = await embed_query(query)
     vector_store = get_vector_store()
-    docs = vector_store.similarity_search(query, k=k)
-    results = []
-    for doc in docs:
-        results.append({
-            "content": doc.page_content,
-            "source": doc.metadata.get("source", "unknown")
-        })
-    return results
+
+    if mode != "hybrid":
+        docs = await asyncio.to_thread(_dense_search, vector_store, embedding, k)
+        return [_to_chunk(doc.page_content, doc.metadata) for doc in docs]
+
+    candidates = max(k, settings.HYBRID_CANDIDATES)
+    lexical_index = get_lexical_index()
+    dense_docs, lexical_hits = await asyncio.gather(
+        asyncio.to_thread(_dense_search, vector_store, embedding, candidates),
+        asyncio.to_thread(lexical_index.search, query, k=candidates),
+        return_exceptions=True,
+    )
+    if isinstance(dense_docs, Exception):
+        raise dense_docs
+
+    chunks = {}
+    dense_ranking = []
+    for doc in dense_docs:
+        key = doc.id or doc.page_content
+        chunks[key] = _to_chunk(doc.page_content, doc.metadata)
+        dense_ranking.append(key)
+
+    lexical_ranking = []
+    if isinstance(lexical_hits, Exception):
+        logger.warning(f"Lexical search failed, using dense results only: {lexical_hits}")
+    else:
+        for doc_id, _ in lexical_hits:
+            doc = lexical_index.get(doc_id)
+            if doc is None:
+                continue
+            chunks.setdefault(doc_id, _to_chunk(doc["content"], doc["metadata"]))
+            lexical_ranking.append(doc_id)
+
+    fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=settings.RRF_K)
+    return [chunks[key] for key in fused[:k]]
 
 def format_context_with_sources(chunks: list) -> tuple:
     """Gabungkan context dan kumpulkan sumber unik"""
     context = ""
     sources = set()
     for i, chunk in enumerate(chunks):
-        context += f"(source: {chunk['source']}):\n{chunk['content']}\n\n"
+        location = chunk['source']
+        if chunk.get('section_path'):
+            location += f", {chunk['section_path']}"
+        if chunk.get('start_seconds') is not None:
+            location += f", {_format_offset(chunk['start_seconds'])}-{_format_offset(chunk['end_seconds'] or chunk['start_seconds'])}"
+        context += f"(source: {location}):\n{chunk['content']}\n\n"
         sources.add(chunk['source'])
-    return context, sources
\ No newline at end of file
+    return context, sources
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+import httpx
+from langchain_openai import OpenAIEmbeddings
+from langchain_pinecone import PineconeVectorStore
+from pinecone import Pinecone
+
+from app.config import settings
+from app.vector_store.local_index import LocalVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """Process-wide holder for the embeddings, Pinecone and vector store clients.
+
+    Clients are created once (on first use or at application startup) and
+    reused by every request, so HTTP sessions and TLS connections are kept
+    alive instead of being rebuilt on each call.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        self._embeddings: Optional[OpenAIEmbeddings] = None
+        self._pinecone: Optional[Pinecone] = None
+        self._index = None
+        self._vector_store = None
+
+    def _http_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def _build_http_client(self) -> httpx.Client:
+        return httpx.Client(limits=self._http_limits(), timeout=settings.HTTP_TIMEOUT)
+
+    def _build_async_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=self._http_limits(), timeout=settings.HTTP_TIMEOUT)
+
+    @property
+    def embeddings(self) -> OpenAIEmbeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    if self._http_client is None:
+                        self._http_client = self._build_http_client()
+                    if self._async_http_client is None:
+                        self._async_http_client = self._build_async_http_client()
+                    self._embeddings = OpenAIEmbeddings(
+                        model=settings.EMBEDDING_MODEL,
+                        http_client=self._http_client,
+                        http_async_client=self._async_http_client,
+                    )
+        return self._embeddings
+
+    @property
+    def pinecone(self) -> Pinecone:
+        if self._pinecone is None:
+            with self._lock:
+                if self._pinecone is None:
+                    self._pinecone = Pinecone(
+                        api_key=settings.PINECONE_API_KEY,
+                        pool_threads=settings.PINECONE_POOL_THREADS,
+                    )
+        return self._pinecone
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self.pinecone.Index(
+                        settings.PINECONE_INDEX_NAME,
+                        pool_threads=settings.PINECONE_POOL_THREADS,
+                        connection_pool_maxsize=settings.PINECONE_CONNECTION_POOL_MAXSIZE,
+                    )
+        return self._index
+
+    @property
+    def uses_local_index(self) -> bool:
+        return settings.VECTOR_STORE_BACKEND == "local"
+
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            with self._lock:
+                if self._vector_store is None:
+                    if self.uses_local_index:
+                        self._vector_store = LocalVectorStore(
+                            embedding=self.embeddings,
+                            path=settings.LOCAL_INDEX_DIR,
+                            search_mode=settings.LOCAL_INDEX_SEARCH,
+                            nlist=settings.LOCAL_INDEX_IVF_NLIST,
+                            nprobe=settings.LOCAL_INDEX_IVF_NPROBE,
+                        )
+                    else:
+                        self._vector_store = PineconeVectorStore(
+                            embedding=self.embeddings, index=self.index)
+        return self._vector_store
+
+    def startup(self):
+        """Build all clients eagerly and optionally warm up their connections"""
+        self.vector_store
+        if settings.WARMUP_ON_STARTUP:
+            self.warmup()
+
+    def warmup(self) -> dict:
+        """Open connections to OpenAI and Pinecone so the first request doesn't pay for them"""
+        timings = {}
+        if not self.uses_local_index:
+            try:
+                start = time.perf_counter()
+                self.index.describe_index_stats()
+                timings["pinecone_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            except Exception as e:
+                logger.warning(f"Pinecone warmup failed: {e}")
+        try:
+            start = time.perf_counter()
+            self.embeddings.embed_query("warmup")
+            timings["embeddings_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        except Exception as e:
+            logger.warning(f"Embeddings warmup failed: {e}")
+        logger.info(f"Client warmup finished: {timings}")
+        return timings
+
+    def health(self) -> dict:
+        """Check that the vector index is reachable"""
+        try:
+            if self.uses_local_index:
+                stats = self.vector_store.describe_index_stats()
+            else:
+                stats = self.index.describe_index_stats()
+            return {"vector_store": "ok", "total_vectors": stats.get("total_vector_count")}
+        except Exception as e:
+            logger.error(f"Vector store health check failed: {e}")
+            return {"vector_store": "error", "detail": str(e)}
+
+    def _detach(self):
+        """Forget every client and return the HTTP clients that still need closing"""
+        with self._lock:
+            clients = self._http_client, self._async_http_client
+            self._http_client = None
+            self._async_http_client = None
+            self._embeddings = None
+            self._index = None
+            self._pinecone = None
+            self._vector_store = None
+        return clients
+
+    async def aclose(self):
+        """Release pooled connections, including the async HTTP pool"""
+        http_client, async_http_client = self._detach()
+        if http_client is not None:
+            http_client.close()
+        if async_http_client is not None:
+            await async_http_client.aclose()
+
+    def close(self):
+        """Release pooled connections from synchronous code; use ``aclose`` inside an event loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.aclose())
+            return
+        raise RuntimeError("ClientRegistry.close() called from a running event loop; await aclose() instead")
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    """Return the process-wide client registry"""
+    return _registry
@@ -0,0 +1,95 @@
+"""Benchmark: offset vs keyset pagination of a user's conversation list.
+
+Seeds one user with N conversations (1,000,000 by default) in a scratch
+database and times fetching a page at increasing depths, once with the old
+OFFSET/LIMIT query of GET /chat/conversations and once with the keyset query
+behind GET /chat/conversations/page. With the (user_id, updated_at, id)
+index the keyset page costs the same at any depth; OFFSET grows linearly.
+
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_conversation_pagination [conversations]
+
+Defaults to a SQLite file in the working directory. Never point it at a
+database whose data you care about: the tables are created and seeded there.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+
+from app.chat.models import Conversation
+from app.chat.router import conversation_page_query
+from app.database import Base
+from app.users.models import User
+from app.utils.pagination import encode_cursor
+
+PAGE_SIZE = 20
+SEED_BATCH = 10_000
+DEPTHS = (0, 1_000, 10_000, 100_000, 500_000, 990_000)
+
+
+def seed(engine, total: int) -> int:
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        user_id = conn.execute(select(User.id).where(User.username == "bench")).scalar()
+        if user_id is None:
+            user_id = conn.execute(insert(User).values(
+                username="bench", email="bench@example.com", password_hash="x", role="student"
+            ).returning(User.id)).scalar_one()
+        existing = conn.execute(select(func.count()).where(Conversation.user_id == user_id)).scalar_one()
+
+    start = datetime(2024, 1, 1)
+    for offset in range(existing, total, SEED_BATCH):
+        rows = [
+            {"user_id": user_id, "title": f"Conversation {i}",
+             "created_at": start + timedelta(seconds=i), "updated_at": start + timedelta(seconds=i)}
+            for i in range(offset, min(offset + SEED_BATCH, total))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(Conversation), rows)
+        print(f"\rseeded {offset + len(rows):,}/{total:,}", end="", flush=True)
+    print()
+    return user_id
+
+
+def timed(conn, query, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        conn.execute(query).all()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    url = os.getenv("BENCH_DATABASE_URL", "sqlite:///bench_conversations.db")
+    engine = create_engine(url)
+    user_id = seed(engine, total)
+
+    offset_query = select(Conversation).where(
+        Conversation.user_id == user_id
+    ).order_by(Conversation.updated_at.desc())
+
+    print(f"{'depth':>10} {'offset ms':>12} {'keyset ms':>12}")
+    with engine.connect() as conn:
+        for depth in DEPTHS:
+            if depth >= total:
+                continue
+            cursor = None
+            if depth:
+                # The row just above the page, as the previous page would have returned it
+                last = conn.execute(
+                    offset_query.with_only_columns(Conversation.updated_at, Conversation.id)
+                    .order_by(None).order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+                    .offset(depth - 1).limit(1)
+                ).one()
+                cursor = encode_cursor({"updated_at": last.updated_at.isoformat(), "id": last.id})
+            offset_ms = timed(conn, offset_query.offset(depth).limit(PAGE_SIZE))
+            keyset_ms = timed(conn, conversation_page_query(user_id, cursor, PAGE_SIZE))
+            print(f"{depth:>10,} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
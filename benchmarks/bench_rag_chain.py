@@ -0,0 +1,66 @@
+"""Micro-benchmark: per-request RAG chain setup cost.
+
+Compares the old approach (new ChatGroq client, prompt parsed and runnable
+graph rebuilt on every message) with the shared chain from app.chat.service.
+No network calls are made; only the setup work is timed.
+
+    python -m benchmarks.bench_rag_chain [iterations]
+"""
+import os
+import sys
+import timeit
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_groq import ChatGroq
+
+from app.chat.service import RAG_TEMPLATE, get_rag_chain, format_chat_history
+from app.config import settings
+
+HISTORY = [("user", "Berapa minimal halaman skripsi?"), ("assistant", "Minimal 40 halaman."), ("user", "Kalau BAB III?")]
+CONTEXT = "(source: Pedoman Skripsi.pdf):\nBAB III berisi metodologi penelitian.\n\n" * 5
+SOURCES = {"Pedoman Skripsi.pdf"}
+
+
+def per_request_setup():
+    """What generate_response used to do before calling the LLM"""
+    llm = ChatGroq(model=settings.CHAT_MODEL)
+    chat_history = format_chat_history(HISTORY)
+    prompt = ChatPromptTemplate.from_template(RAG_TEMPLATE)
+    return (
+        {
+            "context": lambda x: CONTEXT,
+            "question": lambda x: x,
+            "chat_history": lambda _: chat_history,
+            "sources": lambda _: ", ".join(SOURCES)
+        }
+        | prompt
+        | llm
+        | StrOutputParser()
+    )
+
+
+def shared_setup():
+    """What generate_response does now"""
+    inputs = {
+        "context": CONTEXT,
+        "question": HISTORY[-1][1],
+        "chat_history": format_chat_history(HISTORY),
+        "sources": ", ".join(SOURCES),
+    }
+    return get_rag_chain(), inputs
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    get_rag_chain()  # built once at startup in the app
+
+    for name, fn in (("per-request construction", per_request_setup), ("shared chain", shared_setup)):
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+        print(f"{name:>26}: {seconds / iterations * 1e6:10.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
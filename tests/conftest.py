@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read at import time; give the required ones harmless values
+# and keep the database and on-disk indexes in a scratch directory.
+_scratch = tempfile.mkdtemp(prefix="skripsi-tests-")
+for name in (
+    "OPENAI_API_KEY", "GROQ_API_KEY", "MISTRAL_API_KEY", "PINECONE_API_KEY",
+    "DO_SPACE_REGION", "DO_SPACE_KEY", "DO_SPACE_SECRET", "DO_SPACE_NAME",
+):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("DO_SPACE_ENDPOINT", "http://localhost")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("VECTOR_STORE_BACKEND", "local")
+os.environ.setdefault("LOCAL_INDEX_DIR", os.path.join(_scratch, "vector_index"))
+os.environ.setdefault("LEXICAL_INDEX_PATH", os.path.join(_scratch, "vector_index", "bm25.json"))
+os.environ.setdefault("EXTRACTION_CACHE_PATH", os.path.join(_scratch, "extraction_cache.sqlite3"))
+os.environ.setdefault("CHUNK_EMBEDDING_CACHE_PATH", os.path.join(_scratch, "chunk_embeddings.sqlite3"))
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
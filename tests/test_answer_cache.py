@@ -0,0 +1,18 @@
+from app.chat import answer_cache
+from app.chat.answer_cache import SemanticAnswerCache
+
+
+def test_expired_best_match_does_not_hide_a_live_one(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: clock[0])
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=8, ttl=60)
+
+    cache.store([1.0, 0.0], "jawaban lama", ["pedoman.pdf"], corpus_version=1)
+    clock[0] += 30
+    cache.store([0.98, 0.2], "jawaban baru", ["pedoman.pdf"], corpus_version=1)
+    clock[0] += 45  # the first entry has expired, the second is still live
+
+    assert cache.lookup([1.0, 0.0], corpus_version=1) == ("jawaban baru", ["pedoman.pdf"])
+
+    clock[0] += 60
+    assert cache.lookup([1.0, 0.0], corpus_version=1) is None
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import anyio
+import pytest
+
+from app.chat import router
+from app.chat.models import ChatRequest
+
+
+@pytest.mark.anyio
+async def test_disconnect_closes_token_stream(monkeypatch):
+    closed = []
+
+    async def tokens():
+        try:
+            yield "Halo"
+            await anyio.sleep_forever()
+        finally:
+            # Real LLM streams await while closing their HTTP response
+            await anyio.sleep(0)
+            closed.append(True)
+
+    async def start_turn(chat_request, current_user, db, current_utc):
+        return SimpleNamespace(id=1, summary=None), [], 0
+
+    async def stream_response(message, history, summary, corpus_version):
+        return [], tokens()
+
+    monkeypatch.setattr(router, "_start_turn", start_turn)
+    monkeypatch.setattr(router, "stream_response", stream_response)
+    response = await router.stream_message(ChatRequest(message="Halo"), current_user=None, db=None)
+    body = response.body_iterator
+
+    # Starlette cancels the response scope when the client goes away and the
+    # body iterator is closed from inside that cancelled scope
+    with anyio.CancelScope() as scope:
+        try:
+            async for chunk in body:
+                if chunk.startswith("event: token"):
+                    scope.cancel()
+                    await anyio.sleep(0)
+        finally:
+            await body.aclose()
+
+    assert closed == [True]
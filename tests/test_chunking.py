@@ -0,0 +1,33 @@
+from app.knowledge.service import _HEADING, iter_chunks
+
+LONG_BODY = "\n\n".join(
+    f"Paragraf {i}: latar belakang penelitian ini membahas pedoman penulisan skripsi di fakultas "
+    f"dan aturan format yang berlaku untuk setiap bab serta lampiran." for i in range(60))
+
+DOCUMENT = (
+    "# BAB I PENDAHULUAN\n"
+    "## 1.1 Latar Belakang\n"
+    f"{LONG_BODY}\n"
+    "## 1.2 Rumusan Masalah\n"
+    "Bagaimana format penulisan skripsi yang benar?\n"
+    "# BAB II TINJAUAN PUSTAKA\n"
+    "\n"
+    "## 2.1 Landasan Teori\n"
+    "Teori yang digunakan dalam penelitian.\n"
+    "# DAFTAR PUSTAKA\n"
+)
+
+
+def test_no_chunk_is_only_headings():
+    chunks = list(iter_chunks([DOCUMENT[:500], DOCUMENT[500:]]))
+    assert len(chunks) > 2
+    for chunk, _ in chunks:
+        assert any(line.strip() and not _HEADING.match(line) for line in chunk.splitlines()), chunk
+
+
+def test_leading_headings_go_into_the_next_sections_first_chunk():
+    chunks = list(iter_chunks([DOCUMENT]))
+    first, metadata = chunks[0]
+    assert first.startswith("# BAB I PENDAHULUAN\n## 1.1 Latar Belakang\nParagraf 0")
+    assert metadata["section_path"] == "BAB I PENDAHULUAN > 1.1 Latar Belakang"
+    assert any(chunk.startswith("# BAB II TINJAUAN PUSTAKA\n\n## 2.1 Landasan Teori") for chunk, _ in chunks)
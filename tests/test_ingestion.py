@@ -0,0 +1,195 @@
+import json
+import random
+
+import pytest
+
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.knowledge import extraction_cache, service
+from app.knowledge.models import KnowledgeChunk, KnowledgeSource
+from app.users import models as user_models  # noqa: F401 (knowledge_sources references users)
+from app.vector_store import lexical_index
+from app.vector_store.ingestion import BatchedIngestionWriter, IngestionError, upsert_embeddings
+from app.vector_store.local_index import LocalVectorStore
+from app.vector_store.registry import get_client_registry
+
+PAGES = [f"Halaman {n}. " + " ".join(f"kalimat{n}x{i} tentang pedoman skripsi." for i in range(60)) + "\n\n"
+         for n in range(24)]
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """A sqlite-backed ingestion run with the embedder, vector store and PDF extractor faked"""
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.query(KnowledgeChunk).delete()
+        db.query(KnowledgeSource).delete()
+        db.commit()
+
+    state = {"stored": {}, "pages": PAGES, "extractions": 0, "fail_upserts_after": None, "upserts": 0,
+             "before_upsert": lambda: None}
+
+    def iter_pdf_pages(file_path, progress=None):
+        state["extractions"] += 1
+        yield from state["pages"]
+
+    def upsert(self, texts, vectors, metadatas, ids):
+        state["before_upsert"]()
+        if state["fail_upserts_after"] is not None and state["upserts"] >= state["fail_upserts_after"]:
+            raise RuntimeError("vector store unavailable")
+        state["upserts"] += 1
+        state["stored"].update(zip(ids, texts))
+
+    def delete_chunk_vectors(ids=None, filter=None):
+        for id_ in ids or []:
+            state["stored"].pop(id_, None)
+
+    monkeypatch.setattr(settings, "INGEST_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "INGEST_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LOCAL_EXTRACTION_ENABLED", True)
+    monkeypatch.setattr(BatchedIngestionWriter, "_embed", lambda self, texts: [[0.0]] * len(texts))
+    monkeypatch.setattr(BatchedIngestionWriter, "_upsert", upsert)
+    monkeypatch.setattr(service, "iter_pdf_pages", iter_pdf_pages)
+    monkeypatch.setattr(service, "delete_chunk_vectors", delete_chunk_vectors)
+    monkeypatch.setattr(service, "bump_corpus_version", lambda db: None)
+    monkeypatch.setattr(extraction_cache, "_cache", extraction_cache.ExtractionCache(
+        str(tmp_path / "extractions.sqlite3"), 64 * 1024 * 1024))
+
+    pdf = tmp_path / "pedoman.pdf"
+    pdf.write_bytes(b"%PDF-1.4 test document")
+    state["path"] = str(pdf)
+    return state
+
+
+def add_source(path: str, source_id: int = 1):
+    with SessionLocal() as db:
+        db.add(KnowledgeSource(id=source_id, title="Pedoman", file_path=path, file_type="document"))
+        db.commit()
+
+
+def test_retry_after_failed_upsert_reuses_cached_extraction(pipeline):
+    add_source(pipeline["path"])
+    pipeline["fail_upserts_after"] = 1
+    with pytest.raises(IngestionError):
+        service.process_knowledge_source(1, pipeline["path"], "document")
+    assert pipeline["extractions"] == 1
+    assert extraction_cache.get_extraction_cache().stats()["entries"] == 1
+
+    pipeline["fail_upserts_after"] = None
+    service.process_knowledge_source(1, pipeline["path"], "document")
+    assert pipeline["extractions"] == 1
+    assert extraction_cache.get_extraction_cache().stats()["hits"] == 1
+    with SessionLocal() as db:
+        assert db.get(KnowledgeSource, 1).status == "completed"
+        assert db.query(KnowledgeChunk).count() == len(pipeline["stored"])
+
+
+def manifest_ids(source_id: int = 1) -> set:
+    with SessionLocal() as db:
+        return {row.id for row in db.query(KnowledgeChunk.id).filter(KnowledgeChunk.source_id == source_id)}
+
+
+def test_failed_reingest_removes_vectors_of_the_new_version(pipeline, tmp_path):
+    add_source(pipeline["path"])
+    service.process_knowledge_source(1, pipeline["path"], "document")
+    first_version = dict(pipeline["stored"])
+    assert set(first_version) == manifest_ids()
+
+    revised = tmp_path / "pedoman-revisi.pdf"
+    revised.write_bytes(b"%PDF-1.4 revised document")
+    pipeline["pages"] = [page.replace("skripsi", "tesis") for page in PAGES]
+    pipeline["upserts"] = 0
+    pipeline["fail_upserts_after"] = 3
+    with pytest.raises(IngestionError):
+        service.process_knowledge_source(1, str(revised), "document")
+
+    assert pipeline["stored"] == first_version
+    assert manifest_ids() == set(first_version)
+
+
+def test_source_deleted_during_processing_leaves_no_vectors(pipeline):
+    add_source(pipeline["path"])
+
+    def delete_source():
+        with SessionLocal() as db:
+            db.query(KnowledgeSource).filter(KnowledgeSource.id == 1).delete()
+            db.commit()
+    pipeline["before_upsert"] = delete_source
+
+    service.process_knowledge_source(1, pipeline["path"], "document")
+    assert pipeline["stored"] == {}
+
+
+def test_pinecone_upserts_stay_under_the_request_size_limit(monkeypatch):
+    requests = []
+
+    class FakeIndex:
+        def upsert(self, vectors):
+            requests.append(json.dumps(vectors))
+
+    monkeypatch.setattr(settings, "VECTOR_STORE_BACKEND", "pinecone")
+    monkeypatch.setattr(get_client_registry(), "_index", FakeIndex())
+    monkeypatch.setattr(get_client_registry(), "_vector_store", object())
+    texts = [f"Potongan {n} " + "isi pedoman skripsi " * 60 for n in range(64)]
+    vectors = [[random.random() for _ in range(3072)] for _ in texts]
+    upsert_embeddings(texts, vectors, [{"source_id": 1} for _ in texts], [f"source_1_{n}" for n in range(64)])
+
+    assert len(requests) > 1
+    assert all(len(body) <= settings.PINECONE_UPSERT_MAX_BYTES for body in requests)
+    assert sum(len(json.loads(body)) for body in requests) == 64
+
+
+def test_vanished_chunks_are_deleted_on_retry_when_their_deletion_failed(pipeline, tmp_path, monkeypatch):
+    add_source(pipeline["path"])
+    service.process_knowledge_source(1, pipeline["path"], "document")
+    first_version = set(pipeline["stored"])
+
+    revised = tmp_path / "pedoman-revisi.pdf"
+    revised.write_bytes(b"%PDF-1.4 revised document")
+    pipeline["pages"] = PAGES[:12]
+
+    delete_chunk_vectors = service.delete_chunk_vectors
+    failures = [RuntimeError("vector store unavailable")]
+
+    def flaky_delete(ids=None, filter=None):
+        if failures:
+            raise failures.pop()
+        delete_chunk_vectors(ids=ids, filter=filter)
+    monkeypatch.setattr(service, "delete_chunk_vectors", flaky_delete)
+
+    with pytest.raises(RuntimeError):
+        service.process_knowledge_source(1, str(revised), "document")
+    service.process_knowledge_source(1, str(revised), "document")
+
+    assert set(pipeline["stored"]) == manifest_ids()
+    assert set(pipeline["stored"]) < first_version
+
+
+def test_lexical_index_is_only_written_in_hybrid_mode_and_catches_up_when_switched_on(tmp_path, monkeypatch):
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "dense")
+    monkeypatch.setattr(settings, "LEXICAL_INDEX_PATH", str(tmp_path / "bm25.json"))
+    monkeypatch.setattr(lexical_index, "_index", None)
+    monkeypatch.setattr(get_client_registry(), "_vector_store",
+                        LocalVectorStore(embedding=None, path=str(tmp_path / "vector_index")))
+    ids = ["source_1_a", "source_1_b"]
+    with SessionLocal() as db:
+        db.query(KnowledgeChunk).delete()
+        db.query(KnowledgeSource).delete()
+        db.add(KnowledgeSource(id=1, title="Pedoman", file_path="pedoman.pdf", file_type="document"))
+        db.add_all(KnowledgeChunk(id=id_, source_id=1, content_hash=id_) for id_ in ids)
+        db.commit()
+
+    BatchedIngestionWriter()._upsert(["syarat sidang skripsi", "jadwal bimbingan"], [[1.0, 0.0], [0.0, 1.0]],
+                                     [{"source_id": 1}, {"source_id": 1}], ids)
+    assert not (tmp_path / "bm25.json").exists()
+
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "hybrid")
+    assert service.sync_lexical_index() == {"added": 2, "removed": 0}
+    assert [doc_id for doc_id, _ in lexical_index.get_lexical_index().search("sidang")] == ["source_1_a"]
+
+    with SessionLocal() as db:
+        db.query(KnowledgeChunk).filter(KnowledgeChunk.id == "source_1_b").delete()
+        db.commit()
+    assert service.sync_lexical_index() == {"added": 0, "removed": 1}
+    assert lexical_index.get_lexical_index().ids() == {"source_1_a"}
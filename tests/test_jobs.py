@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth.utils import create_access_token, get_password_hash
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.knowledge.jobs import claim_job, enqueue_job, fail_job
+from app.knowledge.models import IngestionJob, KnowledgeChunk, KnowledgeSource
+from app.main import app
+from app.users.models import User
+
+
+@pytest.fixture
+def reingest(tmp_path, monkeypatch):
+    """A completed source with a queued re-ingestion whose replacement file is on disk"""
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(settings, "USE_SPACES", False)
+    monkeypatch.setattr(settings, "INGEST_JOB_MAX_ATTEMPTS", 1)
+    replacement = tmp_path / "upload" / "pedoman-revisi.pdf"
+    replacement.parent.mkdir()
+    replacement.write_bytes(b"%PDF-1.4 revised")
+    with SessionLocal() as db:
+        db.query(IngestionJob).delete()
+        db.query(KnowledgeChunk).delete()
+        db.query(KnowledgeSource).delete()
+        db.add(KnowledgeSource(id=1, title="Pedoman", file_path=str(tmp_path / "pedoman.pdf"),
+                               file_type="document", status="completed"))
+        enqueue_job(db, 1, kind="reingest", payload={"file_path": str(replacement)})
+        db.commit()
+    return replacement
+
+
+def test_final_failure_deletes_the_replacement_file(reingest):
+    job = claim_job("worker-1")
+    assert job.kind == "reingest"
+    assert fail_job(job, "worker-1", "vector store unavailable")
+    assert not reingest.exists()
+    assert not reingest.parent.exists()
+
+
+def test_retryable_failure_keeps_the_replacement_file(reingest):
+    with SessionLocal() as db:
+        db.query(IngestionJob).update({"max_attempts": 3})
+        db.commit()
+    job = claim_job("worker-1")
+    assert fail_job(job, "worker-1", "vector store unavailable")
+    assert reingest.exists()
+
+
+def test_deleting_the_source_deletes_pending_replacement_files(reingest):
+    with SessionLocal() as db:
+        if not db.query(User).filter(User.username == "admin").first():
+            db.add(User(username="admin", email="admin@example.com",
+                        password_hash=get_password_hash("secret"), role="admin"))
+            db.commit()
+    token = create_access_token({"sub": "admin", "role": "admin"})
+
+    response = TestClient(app).delete("/knowledge/1", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert not reingest.exists()
@@ -0,0 +1,28 @@
+import pytest
+
+from app.vector_store.registry import ClientRegistry
+
+
+def test_close_closes_the_async_http_client():
+    registry = ClientRegistry()
+    registry.embeddings
+    http_client, async_http_client = registry._http_client, registry._async_http_client
+
+    registry.close()
+
+    assert http_client.is_closed
+    assert async_http_client.is_closed
+    assert registry._embeddings is None
+
+
+@pytest.mark.anyio
+async def test_aclose_closes_the_async_http_client():
+    registry = ClientRegistry()
+    registry.embeddings
+    async_http_client = registry._async_http_client
+
+    await registry.aclose()
+
+    assert async_http_client.is_closed
+    with pytest.raises(RuntimeError):
+        registry.close()
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_pinecone import PineconeVectorStore
+
+from app.vector_store import pinecone_client
+from app.vector_store.registry import get_client_registry
+
+
+class FakeIndex:
+    """Answers queries the way the Pinecone index client does"""
+
+    config = SimpleNamespace(host="fake-index.pinecone.io", api_key="test")
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, vector, top_k, include_metadata, namespace=None, filter=None):
+        self.queries.append(top_k)
+        matches = [
+            {"id": f"source_1_{n}", "score": 1.0 - n / 10,
+             "metadata": {"text": f"Isi potongan {n}", "source": "Pedoman.pdf", "source_id": 1}}
+            for n in range(top_k)
+        ]
+        return {"matches": matches}
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[0.1, 0.2] for _ in texts]
+
+    def embed_query(self, text):
+        return [0.1, 0.2]
+
+
+@pytest.fixture
+def pinecone_store(monkeypatch):
+    index = FakeIndex()
+    store = PineconeVectorStore(index=index, embedding=FakeEmbeddings())
+    monkeypatch.setattr(get_client_registry(), "_vector_store", store)
+
+    async def embed_query(query):
+        return [0.1, 0.2]
+    monkeypatch.setattr(pinecone_client, "embed_query", embed_query)
+    return index
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+async def test_retrieval_through_pinecone_vector_store(pinecone_store, mode):
+    chunks = await pinecone_client.retrieve_relevant_chunks("format skripsi", k=3, mode=mode)
+
+    assert [chunk["content"] for chunk in chunks] == ["Isi potongan 0", "Isi potongan 1", "Isi potongan 2"]
+    assert all(chunk["source"] == "Pedoman.pdf" for chunk in chunks)
+    assert pinecone_store.queries
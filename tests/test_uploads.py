@@ -0,0 +1,112 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.auth.utils import create_access_token, get_password_hash
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.knowledge.models import IngestionJob, KnowledgeChunk, KnowledgeSource
+from app.main import app
+from app.storage.uploads import LocalUploadWriter, receive_upload
+from app.users.models import User
+
+BOUNDARY = "upload-boundary"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """An admin client whose uploads are stored locally under tmp_path"""
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(settings, "USE_SPACES", False)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    with SessionLocal() as db:
+        db.query(IngestionJob).delete()
+        db.query(KnowledgeChunk).delete()
+        db.query(KnowledgeSource).delete()
+        if not db.query(User).filter(User.username == "admin").first():
+            db.add(User(username="admin", email="admin@example.com",
+                        password_hash=get_password_hash("secret"), role="admin"))
+        db.commit()
+    token = create_access_token({"sub": "admin", "role": "admin"})
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+
+def _stored_files(root):
+    return [os.path.join(d, f) for d, _, files in os.walk(root) for f in files]
+
+
+def _multipart(*parts):
+    body = b""
+    for headers, content in parts:
+        body += f"--{BOUNDARY}\r\n{headers}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def test_upload_is_streamed_to_storage(client, tmp_path):
+    content = os.urandom(3 * 1024 * 1024 + 17)
+
+    response = client.post("/knowledge/upload", data={"title": "Pedoman"},
+                           files={"file": ("pedoman.pdf", content, "application/pdf")})
+
+    assert response.status_code == 200
+    assert response.json()["file_name"] == "Pedoman.pdf"
+    [stored] = _stored_files(tmp_path)
+    with open(stored, "rb") as f:
+        assert f.read() == content
+    with SessionLocal() as db:
+        source = db.query(KnowledgeSource).one()
+        assert source.file_path == stored
+        assert source.content_hash == hashlib.sha256(content).hexdigest()
+
+
+def test_oversized_upload_is_rejected_from_its_content_length(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_SIZE_MB", 1)
+
+    response = client.post("/knowledge/upload", data={"title": "Pedoman"},
+                           files={"file": ("pedoman.pdf", b"x" * (2 * 1024 * 1024), "application/pdf")})
+
+    assert response.status_code == 413
+    assert _stored_files(tmp_path) == []
+
+
+def test_title_must_come_before_the_file(client, tmp_path):
+    body = _multipart(
+        ('Content-Disposition: form-data; name="file"; filename="pedoman.pdf"', b"%PDF-1.4"),
+        ('Content-Disposition: form-data; name="title"', b"Pedoman"),
+    )
+
+    response = client.post("/knowledge/upload", content=body,
+                           headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+    assert response.status_code == 400
+    assert _stored_files(tmp_path) == []
+
+
+@pytest.mark.anyio
+async def test_size_limit_is_enforced_while_streaming(tmp_path):
+    # No Content-Length, as with a chunked request: the limit can only be checked as the body arrives
+    body = _multipart(('Content-Disposition: form-data; name="file"; filename="big.pdf"', b"x" * 4096))
+    chunks = [body[i:i + 512] for i in range(0, len(body), 512)]
+    received = []
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    request = Request({
+        "type": "http", "method": "POST", "path": "/",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }, receive)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await receive_upload(request, "file",
+                             lambda filename, fields: LocalUploadWriter(str(tmp_path / filename)), 1024)
+
+    assert excinfo.value.status_code == 413
+    assert len(received) < 4
+    assert _stored_files(tmp_path) == []
@@ -0,0 +1,71 @@
+import threading
+
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.knowledge import worker
+from app.knowledge.jobs import ClaimedJob
+from app.knowledge.models import IngestionJob, KnowledgeChunk, KnowledgeSource
+from app.users import models as user_models  # noqa: F401 (knowledge_sources references users)
+
+
+def test_heartbeat_keeps_renewing_after_a_failed_renewal(monkeypatch):
+    calls = []
+
+    def extend_lease(job_id, worker_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise RuntimeError("could not connect to server")
+        return True
+
+    monkeypatch.setattr(settings, "INGEST_JOB_LEASE_SECONDS", 1)
+    monkeypatch.setattr(worker, "extend_lease", extend_lease)
+    done = threading.Event()
+    heartbeat = threading.Thread(
+        target=worker._keep_lease, args=(ClaimedJob(7, 1, "ingest", 1, 3), "worker-1", done))
+    heartbeat.start()
+    try:
+        assert not done.wait(2.5)
+    finally:
+        done.set()
+        heartbeat.join()
+    assert len(calls) >= 2
+
+
+def test_worker_loop_survives_database_errors_around_a_job(monkeypatch):
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.query(IngestionJob).delete()
+        db.query(KnowledgeChunk).delete()
+        db.query(KnowledgeSource).delete()
+        db.add(KnowledgeSource(id=1, title="Pedoman", file_path="pedoman.pdf", file_type="document"))
+        db.commit()
+
+    stop = threading.Event()
+    jobs = [ClaimedJob(2, 1, "ingest", 1, 3), ClaimedJob(1, 1, "ingest", 1, 3)]
+    claims = []
+
+    def claim_job(worker_id):
+        claims.append(worker_id)
+        if len(claims) == 2:
+            raise RuntimeError("could not connect to server")
+        if not jobs:
+            stop.set()
+            return None
+        return jobs.pop()
+
+    def complete_job(job_id, worker_id):
+        raise RuntimeError("server closed the connection unexpectedly")
+
+    def process_knowledge_source(source_id, file_path, file_type, report=None, content_hash=None):
+        if len(claims) == 3:
+            raise ValueError("No text extracted")
+
+    monkeypatch.setattr(worker, "claim_job", claim_job)
+    monkeypatch.setattr(worker, "complete_job", complete_job)
+    monkeypatch.setattr(worker, "fail_job", complete_job)
+    monkeypatch.setattr(worker, "process_knowledge_source", process_knowledge_source)
+
+    worker.worker_loop("worker-1", stop, poll_interval=0.01)
+
+    assert len(claims) == 4
+    assert stop.is_set()